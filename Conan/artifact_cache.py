@@ -0,0 +1,116 @@
+import os
+import json
+import time
+import shutil
+import fnmatch
+import hashlib
+
+import build_utils
+
+artifact_patterns = ['*.exe', '*.dll', '*.so', '*.so.*', '*.dylib', '*.a', '*.lib', '*.pdb', '*.exp', 'cmake_pch*', '*.ifc', '*.pcm', '*.gcm', '*.bmi']
+ignored_directories = ['CMakeTmp', 'CompilerIdC', 'CompilerIdCXX']
+
+def get_file_hash(path):
+    file_hash = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+def find_artifacts(build_dir, target_name, excluded_directories=[]):
+    executable_name = os.path.basename(target_name)
+
+    artifacts = []
+    for path, dir_names, file_names in os.walk(build_dir):
+        dir_names[:] = [name for name in dir_names if name not in ignored_directories and name not in excluded_directories]
+        for file_name in file_names:
+            file_path = os.path.join(path, file_name)
+            if any(fnmatch.fnmatch(file_name, pattern) for pattern in artifact_patterns) or (file_name == executable_name and os.access(file_path, os.X_OK)):
+                artifacts.append(os.path.relpath(file_path, build_dir).replace(os.sep, '/'))
+    return sorted(artifacts)
+
+class ArtifactCache:
+
+    def __init__(self, cache_dir, max_size):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    def get_entry_dir(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def has_outputs(self, key, build_dir):
+        manifest = build_utils.read_json(os.path.join(self.get_entry_dir(key), 'manifest.json'))
+        return bool(manifest) and all(os.path.isfile(os.path.join(build_dir, relpath)) for relpath in manifest['Files'])
+
+    def restore(self, key, build_dir):
+        entry_dir = self.get_entry_dir(key)
+        manifest = build_utils.read_json(os.path.join(entry_dir, 'manifest.json'))
+        if not manifest:
+            return None
+
+        for relpath in manifest['Files']:
+            path = os.path.join(build_dir, relpath)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Restored files are newer than anything they were built from, so a later build only redoes what changes
+            shutil.copyfile(os.path.join(entry_dir, 'Files', relpath), path)
+            shutil.copymode(os.path.join(entry_dir, 'Files', relpath), path)
+
+        # The manifest mtime is the last use of the entry for eviction
+        os.utime(os.path.join(entry_dir, 'manifest.json'))
+        return manifest['Files']
+
+    def store(self, key, build_dir, relpaths):
+        entry_dir = self.get_entry_dir(key)
+        if os.path.isfile(os.path.join(entry_dir, 'manifest.json')):
+            return
+
+        temp_dir = f'{entry_dir}.{os.getpid()}.tmp'
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        os.makedirs(temp_dir)
+        size = 0
+        for relpath in relpaths:
+            path = os.path.join(temp_dir, 'Files', relpath)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            shutil.copy2(os.path.join(build_dir, relpath), path)
+            size += os.path.getsize(path)
+
+        with open(os.path.join(temp_dir, 'manifest.json'), 'w') as f:
+            json.dump({ 'Key': key, 'Files': relpaths, 'Size': size, 'Time': time.time() }, f, indent=4)
+
+        try:
+            os.replace(temp_dir, entry_dir)
+        except OSError:
+            # Another build stored the same outputs first
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            return
+
+        self.evict()
+
+    def evict(self):
+        with build_utils.FileLock(os.path.join(self.cache_dir, '.lock')):
+            entries = []
+            for manifest_path in self.find_manifests():
+                manifest = build_utils.read_json(manifest_path, {})
+                entries.append((build_utils.get_mtime(manifest_path) or 0, manifest.get('Size', 0), os.path.dirname(manifest_path)))
+
+            total_size = sum(size for _, size, _ in entries)
+            for _, size, entry_dir in sorted(entries):
+                if total_size <= self.max_size:
+                    break
+                print(f'Evict artifacts: {entry_dir}')
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                total_size -= size
+
+    def find_manifests(self):
+        if not os.path.isdir(self.cache_dir):
+            return []
+        manifests = []
+        for prefix in os.listdir(self.cache_dir):
+            prefix_dir = os.path.join(self.cache_dir, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for key in os.listdir(prefix_dir):
+                manifest_path = os.path.join(prefix_dir, key, 'manifest.json')
+                if os.path.isfile(manifest_path):
+                    manifests.append(manifest_path)
+        return manifests
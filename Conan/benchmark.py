@@ -0,0 +1,225 @@
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import types
+
+script_folder = os.path.dirname(os.path.abspath(__file__))
+
+def install_conan_stubs():
+    # The generator is timed offline, so Conan and CMake are replaced by modules that do nothing
+    class Output:
+        def info(self, *args):
+            pass
+
+    class Folders:
+        build_folder = None
+
+    class Options(dict):
+        def __missing__(self, key):
+            value = self[key] = types.SimpleNamespace()
+            return value
+
+    class ConanFile:
+        def __init__(self, display_name=''):
+            self.display_name = display_name
+            self.output = Output()
+            self.folders = Folders()
+            self.folders.build_folder = os.getcwd()
+            self.options = Options()
+            self.cpp_info = types.SimpleNamespace()
+            self.requirements_list = []
+
+        def requires(self, reference, **kwargs):
+            self.requirements_list.append(reference)
+
+    class CMake:
+        def __init__(self, conanfile):
+            pass
+
+        def configure(self, **kwargs):
+            pass
+
+        def build(self, **kwargs):
+            pass
+
+    conan = types.ModuleType('conan')
+    conan.ConanFile = ConanFile
+    conan.tools = types.ModuleType('conan.tools')
+    cmake = types.ModuleType('conan.tools.cmake')
+    cmake.CMake = CMake
+    conan.tools.cmake = cmake
+
+    sys.modules['conan'] = conan
+    sys.modules['conan.tools'] = conan.tools
+    sys.modules['conan.tools.cmake'] = cmake
+
+def write_file(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(content)
+
+def get_nested_dir(index, depth):
+    return '/'.join(f'Group{(index >> (2 * level)) % 4}' for level in range(depth))
+
+def create_project(root, target_count, file_count, module_count, depth):
+    project_name = os.path.basename(root)
+    write_file(os.path.join(root, project_name + '.project'), 'Version: 1.0.0\n')
+
+    for target_index in range(target_count):
+        target_name = f'Target{target_index}'
+        target_dir = os.path.join(root, target_name)
+
+        dependencies = [f'Target{index}' for index in range(max(0, target_index - 3), target_index)]
+        descriptor = {
+            'Type': 'Library' if target_index < target_count - 1 else 'Application',
+            'PrecompileLocalHeaders': True,
+            'LocalDependencies': [{ 'Name': name } for name in dependencies],
+        }
+        write_file(os.path.join(target_dir, target_name + '.target'), json.dumps(descriptor))
+
+        for file_index in range(file_count):
+            nested_dir = get_nested_dir(file_index, depth)
+            if file_index % 2:
+                write_file(os.path.join(target_dir, 'Include', target_name, nested_dir, f'File{file_index}.hpp'), '#pragma once\n')
+            else:
+                write_file(os.path.join(target_dir, 'Source', nested_dir, f'File{file_index}.cpp'), f'#include "File{file_index + 1}.hpp"\n')
+
+        for module_index in range(module_count):
+            write_file(os.path.join(target_dir, 'Include', target_name, f'Module{module_index}.ixx'), f'export module {target_name}.Module{module_index};\n')
+
+def load_generator(project_path, build_dir, target_name):
+    os.makedirs(build_dir, exist_ok=True)
+    for file_name in ['conanfile.py', 'build_utils.py']:
+        shutil.copy(os.path.join(script_folder, file_name), os.path.join(build_dir, file_name))
+    with open(os.path.join(build_dir, 'build_info.yaml'), 'w') as f:
+        json.dump({ 'Project': project_path, 'Target': target_name, 'Configuration': 'Release' }, f)
+
+    # Every Conan invocation imports a fresh copy of the conanfile and its helpers
+    sys.modules.pop('build_utils', None)
+    sys.path.insert(0, build_dir)
+    try:
+        spec = importlib.util.spec_from_file_location(f'conanfile_{target_name}', os.path.join(build_dir, 'conanfile.py'))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.pop(0)
+
+    return module.TargetGenerator(target_name)
+
+def measure(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def run_case(work_dir, target_count, file_count, module_count, depth, repeat):
+    root = os.path.join(work_dir, f'Bench{target_count}x{file_count}')
+    shutil.rmtree(root, ignore_errors=True)
+    create_project(root, target_count, file_count, module_count, depth)
+    project_path = os.path.join(root, os.path.basename(root) + '.project')
+
+    sys.path.insert(0, script_folder)
+    import tools
+
+    project_tools = tools.ProjectTools()
+    project_tools.project_dir = root
+    project_tools.project_path = project_path
+    project_tools.configuration = 'Release'
+    project_tools.configurations = ['Release']
+    project_tools.multi_config = False
+    project_tools.generator = None
+    project_tools.targets = []
+    project_tools.target_files = {}
+
+    results = {}
+    vscode_dir = os.path.join(root, '.vscode')
+    os.makedirs(vscode_dir, exist_ok=True)
+    results['generate_vscode_project'] = measure(lambda: project_tools.generate_vscode_project(project_path), repeat)
+    results['generate_vscode_tasks'] = measure(lambda: project_tools.generate_vscode_tasks({}, os.path.join(vscode_dir, 'tasks.json')), repeat)
+
+    collect_cold = 0.0
+    collect_warm = 0.0
+    generate_cold = 0.0
+    generate_warm = 0.0
+
+    cwd = os.getcwd()
+    for target_index in range(target_count):
+        target_name = f'Target{target_index}'
+        build_dir = os.path.join(root, '.Build', 'Release', target_name)
+        generator = load_generator(project_path, build_dir, target_name)
+        os.chdir(build_dir)
+        try:
+            def collect_file_paths():
+                generator._source_index = None
+                for folder in ['Source', 'Include']:
+                    for extension in ['cpp', 'ixx', 'hpp', 'h', 'inl']:
+                        generator.collect_file_paths(folder, extension)
+                generator.source_index.save()
+
+            index_path = os.path.join(build_dir, 'source_index.json')
+            if os.path.exists(index_path):
+                os.remove(index_path)
+            collect_cold += measure(collect_file_paths, 1)
+            collect_warm += measure(collect_file_paths, repeat)
+
+            generator._source_index = None
+            generate_cold += measure(generator.generate, 1)
+            generate_warm += measure(generator.generate, repeat)
+        finally:
+            os.chdir(cwd)
+
+    results['collect_file_paths_cold'] = collect_cold
+    results['collect_file_paths_warm'] = collect_warm
+    results['generate_cold'] = generate_cold
+    results['generate_warm'] = generate_warm
+
+    shutil.rmtree(root, ignore_errors=True)
+
+    return [{
+        'Step': step,
+        'Targets': target_count,
+        'FilesPerTarget': file_count,
+        'Files': target_count * (file_count + module_count),
+        'ModulesPerTarget': module_count,
+        'Depth': depth,
+        'Seconds': seconds,
+    } for step, seconds in results.items()]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Python side of project generation on synthetic projects.")
+    parser.add_argument("--Targets", help="Comma separated target counts", default='10,100')
+    parser.add_argument("--Files", help="Comma separated source and header counts per target", default='100,1000')
+    parser.add_argument("--Modules", help="Module interface files per target", type=int, default=2)
+    parser.add_argument("--Depth", help="Folder nesting depth", type=int, default=4)
+    parser.add_argument("--Repeat", help="Repetitions of warm measurements, the fastest is reported", type=int, default=3)
+    parser.add_argument("--WorkDir", help="Directory for the synthetic projects", default=None)
+    parser.add_argument("--Output", help="JSON lines file the results are appended to", default=None)
+    args = parser.parse_args()
+
+    install_conan_stubs()
+
+    work_dir = args.WorkDir or tempfile.mkdtemp(prefix='BuildToolsBenchmark')
+    os.makedirs(work_dir, exist_ok=True)
+
+    for target_count in [int(value) for value in args.Targets.split(',')]:
+        for file_count in [int(value) for value in args.Files.split(',')]:
+            with contextlib.redirect_stdout(io.StringIO()):
+                records = run_case(work_dir, target_count, file_count, args.Modules, args.Depth, args.Repeat)
+            for record in records:
+                line = json.dumps(record)
+                print(line, flush=True)
+                if args.Output:
+                    with open(args.Output, 'a') as f:
+                        f.write(line + '\n')
+
+if __name__ == "__main__":
+    main()
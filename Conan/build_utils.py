@@ -0,0 +1,530 @@
+import os
+import re
+import sys
+import glob
+import json
+import yaml
+import time
+import atexit
+import pickle
+import hashlib
+import cProfile
+import functools
+import threading
+import contextlib
+import fnmatch
+import tempfile
+
+try:
+    from yaml import CFullLoader as YamlLoader
+except ImportError:
+    from yaml import FullLoader as YamlLoader
+
+written_files = []
+yaml_cache = {}
+
+run_path_variables = ['PATH', 'LD_LIBRARY_PATH', 'DYLD_LIBRARY_PATH']
+
+trace_state = threading.local()
+trace = None
+
+def start_trace(tool_name, project_dir):
+    global trace
+    trace_dir = os.environ.get('BUILD_TOOLS_TRACE')
+    if trace is not None or not trace_dir:
+        return
+
+    if trace_dir == '1':
+        trace_dir = os.path.join(project_dir, '.Build', '.Trace')
+
+    trace = {
+        'Tool': tool_name,
+        'Arguments': sys.argv,
+        'Pid': os.getpid(),
+        'Start': time.time(),
+        'Phases': [],
+    }
+    trace_name = f'{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}-{tool_name}'
+    trace_path = os.path.join(trace_dir, trace_name + '.json')
+
+    profiler = None
+    if os.environ.get('BUILD_TOOLS_PROFILE'):
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+
+    def finish_trace():
+        trace['Wall'] = time.perf_counter() - wall_start
+        trace['Cpu'] = time.process_time() - cpu_start
+        os.makedirs(trace_dir, exist_ok=True)
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(os.path.join(trace_dir, trace_name + '.prof'))
+        with open(trace_path, 'w') as f:
+            json.dump(trace, f, indent=4)
+
+    atexit.register(finish_trace)
+
+@contextlib.contextmanager
+def trace_phase(name):
+    if trace is None:
+        yield
+        return
+
+    depth = getattr(trace_state, 'depth', 0)
+    trace_state.depth = depth + 1
+    start = time.time()
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    try:
+        yield
+    finally:
+        trace_state.depth = depth
+        trace['Phases'].append({
+            'Name': name,
+            'Thread': threading.current_thread().name,
+            'Depth': depth,
+            'Start': start - trace['Start'],
+            'Wall': time.perf_counter() - wall_start,
+            'Cpu': time.thread_time() - cpu_start,
+        })
+
+def traced(name):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with trace_phase(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def get_extension(name):
+    extension_start = name.rfind('.')
+    if extension_start <= 0:
+        return None
+    return name[extension_start + 1:]
+
+def get_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+def is_file_content_equal(path, data):
+    try:
+        # Comparing sizes first avoids reading large unchanged files whenever the length differs
+        if os.path.getsize(path) != len(data):
+            return False
+        with open(path, 'rb') as f:
+            return f.read() == data
+    except OSError:
+        return False
+
+def save_file(path, content):
+    data = content.encode() if isinstance(content, str) else content
+    if is_file_content_equal(path, data):
+        return False
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+
+    mode = os.stat(path).st_mode if os.path.isfile(path) else 0o644
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f'.{os.path.basename(path)}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    written_files.append(path)
+    return True
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def copy_file(src, dst):
+    with open(src, 'rb') as f:
+        return save_file(dst, f.read())
+
+class FileLock:
+
+    def __init__(self, path, timeout=60):
+        self.path = path
+        self.timeout = timeout
+        self.fd = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        while True:
+            try:
+                self.fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                return self
+            except FileExistsError:
+                # A lock older than the timeout was left behind by a process that didn't finish
+                lock_mtime = get_mtime(self.path)
+                if lock_mtime is not None and time.time() - lock_mtime / 1e9 > self.timeout:
+                    try:
+                        os.remove(self.path)
+                    except OSError:
+                        pass
+                time.sleep(0.01)
+
+    def __exit__(self, *args):
+        os.close(self.fd)
+        os.remove(self.path)
+
+def read_json(path, default=None):
+    if not os.path.isfile(path):
+        return default
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except ValueError:
+        return default
+
+def get_cache_dir(project_dir, name):
+    return os.path.join(project_dir, '.Build', '.Cache', name)
+
+@traced('Load YAML')
+def load_yaml(path, cache_dir=None):
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+
+    # Values are kept pickled so every caller gets its own copy to modify
+    cached = yaml_cache.get(path)
+    if cached and cached[0] == key:
+        return pickle.loads(cached[1])
+
+    cache_path = os.path.join(cache_dir, hashlib.sha1(path.encode()).hexdigest() + '.pickle') if cache_dir else None
+    if cache_path and os.path.isfile(cache_path):
+        try:
+            with open(cache_path, 'rb') as f:
+                cached = pickle.load(f)
+        except Exception:
+            cached = None
+        if cached and cached[0] == key:
+            yaml_cache[path] = cached
+            return pickle.loads(cached[1])
+
+    with open(path, 'r') as f:
+        value = yaml.load(f, Loader=YamlLoader)
+
+    cached = (key, pickle.dumps(value))
+    yaml_cache[path] = cached
+    if cache_path:
+        save_file(cache_path, pickle.dumps(cached))
+    return value
+
+def is_directory_state_valid(directories):
+    for path, mtime in directories.items():
+        if get_mtime(path) != mtime:
+            return False
+    return True
+
+def is_ignored_directory(name, relpath, ignore):
+    if name.startswith('.'):
+        return True
+    return any(fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(relpath, pattern) for pattern in ignore)
+
+def find_target_files(project_dir, ignore):
+    directories = {}
+    targets = {}
+
+    stack = [project_dir]
+    while stack:
+        path = stack.pop()
+        directories[path] = get_mtime(path)
+        if directories[path] is None:
+            continue
+
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    relpath = os.path.relpath(entry.path, project_dir).replace(os.sep, '/')
+                    if not is_ignored_directory(entry.name, relpath, ignore):
+                        stack.append(entry.path)
+                elif entry.name.endswith('.target') and entry.is_file():
+                    target_name = os.path.basename(path)
+                    targets[target_name] = os.path.relpath(entry.path, project_dir).replace(os.sep, '/')
+
+    return directories, dict(sorted(targets.items()))
+
+@traced('Load Target Manifest')
+def load_target_manifest(project_dir, ignore=[]):
+    manifest_path = os.path.join(project_dir, '.Build', 'Targets.json')
+
+    manifest = None
+    if os.path.isfile(manifest_path):
+        try:
+            with open(manifest_path, 'r') as f:
+                manifest = json.load(f)
+        except ValueError:
+            manifest = None
+
+    if manifest and manifest['Ignore'] == list(ignore) and is_directory_state_valid(manifest['Directories']):
+        return manifest['Targets']
+
+    directories, targets = find_target_files(project_dir, ignore)
+    save_file(manifest_path, json.dumps({ 'Ignore': list(ignore), 'Targets': targets, 'Directories': directories }, indent=4))
+    return targets
+
+class FileInfoCache:
+
+    def __init__(self, path):
+        self.path = path
+        self.changed = False
+        self.entries = {}
+
+        if os.path.isfile(path):
+            try:
+                with open(path, 'r') as f:
+                    self.entries = json.load(f)
+            except ValueError:
+                self.entries = {}
+
+    def get(self, path, compute):
+        stat = os.stat(path)
+        key = [stat.st_mtime_ns, stat.st_size]
+
+        entry = self.entries.get(path)
+        if entry and entry[0] == key:
+            return entry[1]
+
+        value = compute(path)
+        self.entries[path] = [key, value]
+        self.changed = True
+        return value
+
+    def save(self):
+        if not self.changed:
+            return
+
+        self.entries = { path: entry for path, entry in self.entries.items() if os.path.exists(path) }
+        save_file(self.path, json.dumps(self.entries))
+        self.changed = False
+
+def scan_directory(root):
+    directories = {}
+    files = {}
+
+    stack = [root]
+    while stack:
+        path = stack.pop()
+        # The mtime is taken before listing so a change made during the scan invalidates the result
+        directories[path] = get_mtime(path)
+        if directories[path] is None:
+            continue
+
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    if not entry.name.startswith('.'):
+                        stack.append(entry.path)
+                elif entry.is_file():
+                    extension = get_extension(entry.name)
+                    if extension:
+                        files.setdefault(extension, []).append(entry.path)
+
+    for paths in files.values():
+        paths.sort()
+
+    return directories, files
+
+class SourceIndex:
+
+    def __init__(self, path):
+        self.path = path
+        self.changed = False
+        self.roots = {}
+
+        if os.path.isfile(path):
+            try:
+                with open(path, 'r') as f:
+                    self.roots = json.load(f)
+            except ValueError:
+                self.roots = {}
+
+    def is_up_to_date(self):
+        if not self.roots:
+            return False
+        return all(is_directory_state_valid(entry['Directories']) for entry in self.roots.values())
+
+    @traced('Scan Sources')
+    def scan(self, root):
+        entry = self.roots.get(root)
+        if entry and is_directory_state_valid(entry['Directories']):
+            return entry['Files']
+
+        directories, files = scan_directory(root)
+        self.roots[root] = { 'Directories': directories, 'Files': files }
+        self.changed = True
+        return files
+
+    def save(self):
+        if not self.changed:
+            return
+
+        save_file(self.path, json.dumps(self.roots))
+        self.changed = False
+
+def is_process_alive(pid):
+    if sys.platform == 'win32':
+        import ctypes
+        process = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)
+        if not process:
+            return False
+        exit_code = ctypes.c_ulong()
+        ctypes.windll.kernel32.GetExitCodeProcess(process, ctypes.byref(exit_code))
+        ctypes.windll.kernel32.CloseHandle(process)
+        return exit_code.value == 259
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class JobSlots:
+
+    def __init__(self, total=None, directory=None):
+        self.total = total or int(os.environ.get('BUILD_TOOLS_JOB_BUDGET', 0)) or os.cpu_count()
+        self.directory = directory or os.path.join(tempfile.gettempdir(), 'BuildToolsJobs')
+        self.paths = []
+
+    def read_pid(self, path):
+        try:
+            with open(path, 'r') as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return None
+
+    def try_claim(self, path):
+        # The slot appears with the pid already written, so other builds never see an empty slot
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix='.claim.', suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            f.write(str(os.getpid()))
+        try:
+            os.link(temp_path, path)
+        except FileExistsError:
+            self.take_over(path)
+            return False
+        except FileNotFoundError:
+            return False
+        finally:
+            remove_file(temp_path)
+
+        self.paths.append(path)
+        return True
+
+    def take_over(self, path):
+        # Slots of builds that were killed are freed, a slot without a readable pid is still held
+        pid = self.read_pid(path)
+        if pid is None or is_process_alive(pid):
+            return
+
+        stale_path = f'{path}.{os.getpid()}.{threading.get_ident()}.stale'
+        try:
+            os.rename(path, stale_path)
+        except OSError:
+            return
+        if self.read_pid(stale_path) != pid:
+            # Another build claimed the slot in between, give it back
+            try:
+                os.link(stale_path, path)
+            except OSError:
+                pass
+        remove_file(stale_path)
+
+    def acquire(self, count, timeout=None):
+        # Every build on the machine takes slots from the same folder, so concurrent builds share the cores
+        os.makedirs(self.directory, exist_ok=True)
+        count = max(1, min(count, self.total))
+        timeout = timeout or float(os.environ.get('BUILD_TOOLS_JOB_TIMEOUT', 600))
+        start_time = time.time()
+        while True:
+            for index in range(self.total):
+                if len(self.paths) == count:
+                    break
+                self.try_claim(os.path.join(self.directory, f'{index}.slot'))
+            if self.paths:
+                return len(self.paths)
+            if time.time() - start_time > timeout:
+                print(f'No free job slot in {self.directory} after {int(timeout)}s, building with 1 job')
+                return 1
+            time.sleep(0.5)
+
+    def release(self):
+        for path in self.paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.paths = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+def read_run_environment_script(path):
+    batch = path.endswith('.bat')
+
+    variables = {}
+    with open(path, 'r', errors='ignore') as f:
+        for line in f:
+            # set "PATH=a;b;%PATH%" in batch files, export PATH="a:b:$PATH" in shell scripts
+            match = re.match(r'\s*set\s+"(\w+)=(.*)"\s*$', line) if batch else re.match(r'\s*export\s+(\w+)="(.*)"\s*$', line)
+            if not match:
+                continue
+
+            # References to the current environment are stored as ${NAME} and filled in at launch
+            name, value = match.groups()
+            if batch:
+                value = re.sub(r'%(\w+)%', r'${\1}', value)
+            else:
+                value = re.sub(r'\$(\w+)', r'${\1}', value)
+            variables[name] = value
+    return variables
+
+def load_run_environment(build_dir, configuration):
+    extension = '.bat' if sys.platform == 'win32' else '.sh'
+    script_paths = sorted(glob.glob(os.path.join(build_dir, f'conanrunenv-{configuration.lower()}*{extension}')))
+    if not script_paths:
+        script_paths = sorted(glob.glob(os.path.join(build_dir, f'conanrunenv-*{extension}')))
+
+    sources = {}
+    for path in script_paths:
+        stat = os.stat(path)
+        sources[path] = [stat.st_mtime_ns, stat.st_size]
+
+    cache_path = os.path.join(build_dir, f'run_environment.{configuration}.json')
+    cached = read_json(cache_path)
+    if cached and cached['Sources'] == sources:
+        return cached['Variables']
+
+    variables = {}
+    for path in script_paths:
+        variables.update(read_run_environment_script(path))
+    save_file(cache_path, json.dumps({ 'Sources': sources, 'Variables': variables }, indent=4))
+    return variables
+
+def resolve_run_environment(variables, environment):
+    resolved = dict(environment)
+    for name, value in variables.items():
+        value = re.sub(r'\$\{(\w+)\}', lambda match: environment.get(match.group(1), ''), value)
+        # A reference to an unset variable would leave an empty entry, which means the current folder in search paths
+        resolved[name] = os.pathsep.join(path for path in value.split(os.pathsep) if path) if name in run_path_variables else value
+    return resolved
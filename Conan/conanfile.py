@@ -1,9 +1,11 @@
-from conan import ConanFile, tools
+from conan import ConanFile
 from conan.tools.cmake import CMake
 
-import os, yaml, glob, hashlib, argparse, io
+import os, re, glob, json, hashlib, fnmatch, argparse, io, subprocess
 from pathlib import PureWindowsPath
 
+import build_utils
+
 script_folder = os.path.dirname(os.path.abspath(__file__))
 
 class TargetGenerator(ConanFile):
@@ -14,6 +16,7 @@ class TargetGenerator(ConanFile):
     project_path = None
     target_name = None
     _target = None
+    _source_index = None
 
     options = { "shared" : [True, False] }
     default_options = { "shared": True }
@@ -21,39 +24,45 @@ class TargetGenerator(ConanFile):
     def __init__(self, arg):
         super().__init__(arg)
         
-        with open(os.path.join(script_folder, 'build_info.yaml'), 'r') as f:
-            build_info = yaml.load(f, Loader=yaml.FullLoader)
+        build_info = build_utils.load_yaml(os.path.join(script_folder, 'build_info.yaml'))
 
         self.project_path = build_info['Project']
+        build_utils.start_trace('conanfile', os.path.dirname(self.project_path))
         self.target_name = build_info['Target']
+        self.configuration = build_info['Configuration']
+        self.build_root = build_info.get('BuildRoot', os.path.join(os.path.dirname(self.project_path), '.Build', self.configuration))
 
         self.project_base_dir = PureWindowsPath(os.path.normpath(os.path.dirname(self.project_path))).as_posix()
 
     @property
     def target(self):
-        if self._target:
-            return self._target
+        if not self._target:
+            self._target = self.load_target()
+        return self._target
 
+    @build_utils.traced('Load Target')
+    def load_target(self):
         print(f'Loading {self.target_name} target from {self.project_path}')
 
-        self.project = None
-        with open(self.project_path, 'r') as f:
-            self.project = yaml.load(f, Loader=yaml.FullLoader)
-
-            target_path = os.path.join(os.path.dirname(self.project_path), self.target_name, self.target_name + '.target')
-            if os.path.exists(target_path):
-                print('Loading Target:', target_path)
-                with open(target_path, 'r') as target_file:
-                    self._target = yaml.load(target_file, Loader=yaml.FullLoader)
-                print(self._target)
-                return self._target
-            else:
-                for target in self.project.get('Targets', []):
-                    target_name = target['Name']
-                    if self.target_name.endswith(target_name):
-                        self._target = target
-                        self.target_name = target_name
-                        return self._target
+        project_dir = os.path.dirname(self.project_path)
+        cache_dir = build_utils.get_cache_dir(project_dir, 'Descriptors')
+        self.project = build_utils.load_yaml(self.project_path, cache_dir)
+
+        target_files = build_utils.load_target_manifest(project_dir, self.project.get('IgnoreDirectories', []))
+        self.project_target_names = set(target_files) | { target['Name'] for target in self.project.get('Targets', []) }
+        target_path = os.path.join(project_dir, target_files.get(self.target_name, os.path.join(self.target_name, self.target_name + '.target')))
+        if os.path.exists(target_path):
+            print('Loading Target:', target_path)
+            self._target = build_utils.load_yaml(target_path, cache_dir)
+            print(self._target)
+            return self._target
+        else:
+            for target in self.project.get('Targets', []):
+                target_name = target['Name']
+                if self.target_name.endswith(target_name):
+                    self._target = target
+                    self.target_name = target_name
+                    return self._target
 
         raise RuntimeError(f'Target \"{self.target_name}\" not found.')
 
@@ -65,21 +74,309 @@ class TargetGenerator(ConanFile):
     def target_dir(self):
         return os.path.join(self.project_base_dir, self.target_name)
 
+    @property
+    def source_index(self):
+        if not self._source_index:
+            self._source_index = build_utils.SourceIndex(os.path.join(script_folder, 'source_index.json'))
+        return self._source_index
+
     def collect_file_paths(self, folder, extension):
-        paths = glob.glob(f'{self.target_dir}/{folder}/**/.*.{extension}', recursive=True) + glob.glob(f'{self.target_dir}/{folder}/**/*.{extension}', recursive=True)
+        paths = self.source_index.scan(f'{self.target_dir}/{folder}').get(extension, [])
         return [PureWindowsPath((os.path.normpath(path))).as_posix() for path in paths]
 
     def get_all_subfolder_paths(self, folder):
         return [name for name in glob.glob(f'{self.target_dir}/{folder}/**/*/', recursive=True) if os.path.isdir(name)]
 
+    @build_utils.traced('Save File')
     def save_file(self, path, content):
-        content_hash = hashlib.sha256(content.encode()).hexdigest()
-        file_hash = hashlib.sha256(open(path, 'rb').read()).hexdigest() if os.path.isfile(path) else None
+        if build_utils.save_file(path, content):
+            print(f'Write: {path}')
+        else:
+            print(f'Unchanged: {path}')
+
+    def get_unity_batches(self, paths):
+        batch_size = max(1, int(self.target.get('UnityBatchSize', 8)))
+        batch_bytes = int(self.target.get('UnityBatchBytes', 0))
+
+        batches = []
+        batch = []
+        batch_total_bytes = 0
+        for path in paths:
+            file_size = os.path.getsize(path)
+            if batch and batch_bytes and batch_total_bytes + file_size > batch_bytes:
+                batches.append(batch)
+                batch = []
+                batch_total_bytes = 0
+
+            batch.append(path)
+            batch_total_bytes += file_size
+
+            # Batch boundaries depend only on file paths, so adding, removing or editing a file only affects its own batch
+            relpath = os.path.relpath(path, start=self.target_dir)
+            if int(hashlib.sha1(relpath.encode()).hexdigest()[:8], 16) % batch_size == 0:
+                batches.append(batch)
+                batch = []
+                batch_total_bytes = 0
+
+        if batch:
+            batches.append(batch)
+
+        return batches
+
+    @build_utils.traced('Generate Unity Sources')
+    def generate_unity_sources(self, cmake_target_name, source_file_paths):
+        unity_dir = os.path.join(script_folder, 'Unity')
+        unity_exclude = self.target.get('UnityExclude', [])
+
+        excluded_file_paths = []
+        unity_file_paths = []
+        for path in source_file_paths:
+            relpath = PureWindowsPath(os.path.relpath(path, start=self.target_dir)).as_posix()
+            if any(fnmatch.fnmatch(relpath, pattern) for pattern in unity_exclude):
+                excluded_file_paths.append(path)
+            else:
+                unity_file_paths.append(path)
+
+        unity_sources = []
+        for batch in self.get_unity_batches(unity_file_paths):
+            batch_id = hashlib.sha1(os.path.relpath(batch[-1], start=self.target_dir).encode()).hexdigest()[:8]
+            unity_source_path = PureWindowsPath(os.path.join(unity_dir, f'{cmake_target_name}.unity.{batch_id}.cpp')).as_posix()
+            self.save_file(unity_source_path, ''.join(f'#include "{path}"\n' for path in batch))
+            unity_sources.append(unity_source_path)
+
+        if os.path.isdir(unity_dir):
+            for path in glob.glob(os.path.join(unity_dir, f'{cmake_target_name}.unity.*.cpp')):
+                if PureWindowsPath(path).as_posix() not in unity_sources:
+                    os.remove(path)
+
+        return unity_sources + excluded_file_paths
+
+    def read_includes(self, path):
+        # Includes inside #if blocks depend on the platform or configuration, so only unconditional ones are collected
+        includes = []
+        depth = 0
+        guard_depth = 0
+        guard_name = None
+        with open(path, 'r', errors='ignore') as f:
+            for line in f:
+                match = re.match(r'\s*#\s*(\w+)\s*(.*)', line)
+                if not match:
+                    continue
+                directive, argument = match.groups()
+                argument = argument.split()
+
+                # A leading #ifndef X followed by #define X is the header guard, it wraps the whole file
+                if guard_name:
+                    if directive == 'define' and argument[:1] == [guard_name]:
+                        guard_depth = 1
+                    guard_name = None
+
+                if directive in ['if', 'ifdef', 'ifndef']:
+                    if directive == 'ifndef' and depth == 0 and guard_depth == 0 and not includes and argument:
+                        guard_name = argument[0]
+                    depth += 1
+                elif directive == 'endif':
+                    depth = max(0, depth - 1)
+                elif directive == 'include' and depth <= guard_depth:
+                    match = re.match(r'\s*#\s*include\s*[<"]([^>"]+)[>"]', line)
+                    if match:
+                        includes.append(match.group(1))
+        return includes
+
+    def resolve_include(self, include, path, include_dirs):
+        for include_dir in [os.path.dirname(path)] + include_dirs:
+            include_path = PureWindowsPath(os.path.normpath(os.path.join(include_dir, include))).as_posix()
+            if os.path.isfile(include_path):
+                return include_path
+        return None
+
+    def get_change_counts(self):
+        history_commits = int(self.target.get('PrecompileHistoryCommits', 100))
+        try:
+            args = ['git', 'log', '-n', str(history_commits), '--name-only', '--format=', '--', '.']
+            log = subprocess.run(args, cwd=self.project_base_dir, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, check=True).stdout
+            args = ['git', 'rev-parse', '--show-toplevel']
+            top_level_dir = subprocess.run(args, cwd=self.project_base_dir, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return {}
+
+        change_counts = {}
+        for line in log.splitlines():
+            if line:
+                path = PureWindowsPath(os.path.normpath(os.path.join(top_level_dir, line))).as_posix()
+                change_counts[path] = change_counts.get(path, 0) + 1
+        return change_counts
+
+    @build_utils.traced('Select Precompiled Headers')
+    def get_auto_precompiled_headers(self, file_paths, excluded_includes):
+        # The selection is kept until an update is requested, so the precompiled header doesn't change on its own
+        selection_path = os.path.join(script_folder, 'auto_precompiled_headers.json')
+        selection = build_utils.read_json(selection_path)
+        if selection is not None and not os.environ.get('BUILD_TOOLS_UPDATE_PCH'):
+            local_headers = [path for path in selection['Local'] if os.path.isfile(path)]
+            print('Auto Precompiled Headers:', selection['External'] + local_headers)
+            return selection['External'], local_headers
+
+        min_includes = int(self.target.get('PrecompileMinIncludes', 3))
+        max_changes = int(self.target.get('PrecompileMaxChanges', 2))
+
+        include_dirs = [f'{self.target_dir}/Include', f'{self.target_dir}/Source']
+        for dependency in self.target.get('LocalDependencies', []):
+            dependency_name = dependency['Name'].split('/')[0] if isinstance(dependency, dict) else dependency.split('/')[0]
+            include_dirs.append(os.path.join(self.project_base_dir, dependency_name, 'Include'))
+
+        include_index = build_utils.FileInfoCache(os.path.join(script_folder, 'unconditional_includes.json'))
+
+        include_counts = {}
+        resolved_includes = {}
+        for path in file_paths:
+            for include in set(include_index.get(path, self.read_includes)):
+                if include in excluded_includes:
+                    continue
+
+                include_counts[include] = include_counts.get(include, 0) + 1
+                resolved_include = self.resolve_include(include, path, include_dirs)
+                if resolved_include:
+                    resolved_includes.setdefault(include, set()).add(resolved_include)
+        include_index.save()
+
+        # Headers that can't be resolved belong to system or package dependencies and are considered stable,
+        # local ones are stable when few of the recent commits touched them
+        change_counts = self.get_change_counts()
+        external_headers = []
+        local_headers = []
+        for include, count in sorted(include_counts.items(), key=lambda item: (-item[1], item[0])):
+            if count < min_includes:
+                continue
+
+            include_paths = sorted(resolved_includes.get(include, []))
+            if not include_paths:
+                external_headers.append(include)
+            elif all(change_counts.get(include_path, 0) <= max_changes for include_path in include_paths):
+                local_headers.extend(include_path for include_path in include_paths if include_path not in local_headers)
+
+        print('Auto Precompiled Headers:', external_headers + local_headers)
+        build_utils.save_file(selection_path, json.dumps({ 'External': external_headers, 'Local': local_headers }, indent=4))
+        return external_headers, local_headers
+
+    @build_utils.traced('Register Precompiled Header')
+    def register_precompiled_header(self, content):
+        content_hash = hashlib.sha256(content.encode())
+        for key in ['LocalDependencies', 'PublicDependencies', 'PrivateDependencies', 'PrivateDependencyOverrides']:
+            content_hash.update(repr(self.target.get(key, [])).encode())
+        content_hash.update(repr(self.target.get('StaticLinkage', False)).encode())
+        content_hash.update(self.target.get('Type', 'Application').encode())
+        if '#include "' in content:
+            # Quoted includes are resolved relative to the target's own folders
+            content_hash.update(self.target_dir.encode())
+        content_hash = content_hash.hexdigest()
+
+        registry_path = os.path.join(self.build_root, 'PrecompiledHeaders.json')
+        with build_utils.FileLock(registry_path + '.lock'):
+            # Targets that were removed from the project no longer own a precompiled header
+            registry = { target_name: target_hash for target_name, target_hash in build_utils.read_json(registry_path, {}).items() if target_name in self.project_target_names }
+            registry[self.target_name] = content_hash
+            build_utils.save_file(registry_path, json.dumps(registry, indent=4))
+
+        # The first registered target with the same content owns the shared precompiled header
+        return next(target_name for target_name, target_hash in registry.items() if target_hash == content_hash)
+
+    def get_precompile_headers_commands(self, cmake_target_name, precompiled_header_file_name, content):
+        command = f'target_precompile_headers({cmake_target_name} PRIVATE {precompiled_header_file_name})'
+
+        owner_target_name = self.register_precompiled_header(content)
+        # tools.py builds the owner before this target, so its precompiled header is finished when this one compiles
+        self.save_file(os.path.join(script_folder, 'precompiled_header_owner.txt'), owner_target_name if owner_target_name != self.target_name else '')
+        if owner_target_name == self.target_name:
+            return [command]
+
+        owner_cmake_target_name = os.path.basename(owner_target_name)
+        owner_build_dir = os.path.join(self.build_root, owner_target_name)
+        owner_pch_path = PureWindowsPath(os.path.normpath(os.path.join(owner_build_dir, 'CMakeFiles', f'{owner_cmake_target_name}.dir', 'cmake_pch.hxx'))).as_posix()
+        print(f'Reuse precompiled header from {owner_target_name}: {owner_pch_path}')
+
+        # CMake can't share precompiled headers between projects, so GCC picks the owner's cmake_pch.hxx.gch up
+        # through -include, other compilers and multi-config trees use the target's own header
+        return [
+            f'if(CMAKE_CXX_COMPILER_ID STREQUAL "GNU" AND NOT CMAKE_CONFIGURATION_TYPES)',
+            f'    target_compile_options({cmake_target_name} PRIVATE -Winvalid-pch -include {owner_pch_path})',
+            'else()',
+            f'    {command}',
+            'endif()',
+        ]
 
-        print(f'{path}: {file_hash} -> {content_hash}')
-        if file_hash != content_hash:
-            tools.files.save(self, path, content)
+    def read_module_declarations(self, path):
+        exports = []
+        imports = []
+        with open(path, 'r', errors='ignore') as f:
+            for line in f:
+                match = re.match(r'\s*export\s+module\s+([\w.:]+)\s*;', line)
+                if match:
+                    exports.append(match.group(1))
+                    continue
+                match = re.match(r'\s*(?:export\s+)?import\s+([\w.:]+)\s*;', line)
+                if match and not match.group(1).startswith(':'):
+                    imports.append(match.group(1))
+        return [exports, imports]
+
+    @build_utils.traced('Scan Modules')
+    def scan_modules(self, file_paths):
+        module_index = build_utils.FileInfoCache(os.path.join(script_folder, 'module_index.json'))
+
+        exported_modules = set()
+        imported_modules = set()
+        for path in file_paths:
+            exports, imports = module_index.get(path, self.read_module_declarations)
+            exported_modules.update(exports)
+            imported_modules.update(imports)
+        module_index.save()
+
+        return exported_modules, imported_modules - exported_modules
+
+    @build_utils.traced('Register Modules')
+    def register_modules(self, module_names):
+        registry_path = os.path.join(self.build_root, 'Modules.json')
+        with build_utils.FileLock(registry_path + '.lock'):
+            registry = build_utils.read_json(registry_path, {})
+            registry = { name: target_name for name, target_name in registry.items() if target_name != self.target_name and target_name in self.project_target_names }
+            registry.update({ name: self.target_name for name in module_names })
+            build_utils.save_file(registry_path, json.dumps(registry, indent=4, sort_keys=True))
+        return registry
+
+    def get_module_reuse_commands(self, cmake_target_name, imported_modules, registry):
+        dependency_names = set()
+        for key in ['LocalDependencies', 'PublicDependencies', 'PrivateDependencies']:
+            for dependency in self.target.get(key, []):
+                dependency_names.add(dependency['Name'].split('/')[0] if isinstance(dependency, dict) else dependency.split('/')[0])
+
+        # Interfaces re-export the other modules of their target, so all of an owner's modules are referenced
+        owner_target_names = { registry.get(module_name) for module_name in imported_modules } - { None }
+        owner_target_names = { target_name for target_name in owner_target_names if os.path.basename(target_name) in dependency_names }
+
+        # tools.py builds the owners before this target, so their BMIs exist when this one compiles
+        self.save_file(os.path.join(script_folder, 'module_owners.txt'), '\n'.join(sorted(owner_target_names)))
+
+        commands = []
+        for module_name, owner_target_name in sorted(registry.items()):
+            if owner_target_name not in owner_target_names:
+                continue
 
+            owner_cmake_target_name = os.path.basename(owner_target_name)
+            owner_object_dir = os.path.join(self.build_root, owner_target_name, 'CMakeFiles', f'{owner_cmake_target_name}.dir')
+            bmi_path = PureWindowsPath(os.path.normpath(os.path.join(owner_object_dir, module_name.replace(':', '-')))).as_posix()
+            print(f'Reuse module interface {module_name} from {owner_target_name}: {bmi_path}')
+
+            # GCC needs a module mapper and multi-config trees have a BMI per configuration, so both keep compiling the interface themselves
+            commands.extend([
+                f'if(NOT CMAKE_CONFIGURATION_TYPES AND MSVC)',
+                f'    target_compile_options({cmake_target_name} PRIVATE /reference {module_name}={bmi_path}.ifc)',
+                f'elseif(NOT CMAKE_CONFIGURATION_TYPES AND CMAKE_CXX_COMPILER_ID MATCHES "Clang")',
+                f'    target_compile_options({cmake_target_name} PRIVATE -fmodule-file={module_name}={bmi_path}.pcm)',
+                'endif()',
+            ])
+        return commands
+
+    @build_utils.traced('Hook: configure')
     def configure(self):
         dependencies = self.target.get('PublicDependencies', []) + self.target.get('PrivateDependencies', [])
         print('Configure', dependencies)
@@ -110,6 +407,7 @@ class TargetGenerator(ConanFile):
         self.requires(package_name + '/' + package_version, **kwargs)
 
 
+    @build_utils.traced('Hook: requirements')
     def requirements(self):
         for dependency in self.target.get('LocalDependencies', []):
             self.add_dependency(dependency, transitive_headers=True, transitive_libs=True)
@@ -123,8 +421,44 @@ class TargetGenerator(ConanFile):
         for dependency in self.target.get('PrivateDependencyOverrides', []):
             self.add_dependency(dependency, transitive_headers=False, transitive_libs=False, override=True)
 
+    @build_utils.traced('Hook: generate')
     def generate(self):
-        cmake_project_path = os.path.join(str(self.folders.build_folder), 'CMakeLists.txt')
+        self.generate_project()
+
+        # tools.py installs without configuring and configures once all configurations are installed
+        if not os.environ.get('BUILD_TOOLS_SKIP_CONFIGURE'):
+            self.configure_cmake()
+
+        self.generate_run_environment()
+
+        self.output.info(f'Rewritten files: {len(build_utils.written_files)}')
+        for path in build_utils.written_files:
+            self.output.info(f'  {path}')
+
+    def generate_run_environment(self):
+        bat_files = glob.glob(os.path.join(script_folder, "conanrunenv-*.bat"))
+
+        for bat_file in bat_files:
+            with open(bat_file, "r") as f:
+                lines = f.readlines()
+
+            path_line = '\n'
+            for line in lines:
+                if line.startswith('set "PATH='):
+                    path_line = line.strip()[5:-2]
+                    break
+
+            self.save_file(os.path.join(script_folder, 'conanrun.env'), path_line)
+
+        # Elsewhere the shell scripts are parsed once into the run environment cache the Run command uses
+        if not bat_files:
+            variables = build_utils.load_run_environment(script_folder, self.configuration)
+            environment = build_utils.resolve_run_environment(variables, os.environ)
+            self.save_file(os.path.join(script_folder, 'conanrun.env'), ''.join(f'{name}={environment[name]}\n' for name in variables))
+
+    @build_utils.traced('Generate Project')
+    def generate_project(self):
+        cmake_project_path = os.path.join(script_folder, 'CMakeLists.txt')
         self.output.info(f'Generate {cmake_project_path}')
 
         cmake_find_packages = []
@@ -138,15 +472,15 @@ class TargetGenerator(ConanFile):
                 continue
             cmake_find_packages.append(f'find_package({package} REQUIRED)')
 
-        import re
         print(target_files)
-        for path in target_files:
-            with open(path) as f:
-                for line in f:
-                    match = re.search(r"Conan: Target declared '([^']+)'", line)
-                    if match:
-                        cmake_target = match.group(1)
-                        cmake_link_packages.append(cmake_target)
+        with build_utils.trace_phase('Scan CMake Targets'):
+            for path in target_files:
+                with open(path) as f:
+                    for line in f:
+                        match = re.search(r"Conan: Target declared '([^']+)'", line)
+                        if match:
+                            cmake_target = match.group(1)
+                            cmake_link_packages.append(cmake_target)
 
         cmake_target_name = os.path.basename(self.target_name)
         version = self.target.get('PackageVersion', self.project_version)
@@ -161,6 +495,7 @@ class TargetGenerator(ConanFile):
             'endif()',
             'set(CMAKE_EXPERIMENTAL_CXX_MODULE_DYNDEP 1)',
             'set(CMAKE_CXX_EXTENSIONS OFF)',
+            'set(CMAKE_EXPORT_COMPILE_COMMANDS ON)',
         ]
 
         if cmake_find_packages:
@@ -194,6 +529,7 @@ class TargetGenerator(ConanFile):
         inline_include_file_paths = []
         for e in ['inl']:
             inline_include_file_paths.extend(self.collect_file_paths(include_base_dir, e))
+        self.source_index.save()
 
         precompile_local_haders = self.target.get('PrecompileLocalHeaders', False)
         precompile_public_haders = self.target.get('PrecompilePublicHeaders', precompile_local_haders)
@@ -203,7 +539,15 @@ class TargetGenerator(ConanFile):
         package_header_file_path = os.path.join(script_folder, package_header_file_name)
 
         precompiled_header_file_name = f'{cmake_target_name}.pch.hpp'
-        precompiled_header_file_path = os.path.join(script_folder, package_header_file_name)
+        precompiled_header_file_path = os.path.join(script_folder, precompiled_header_file_name)
+
+        auto_precompile_public_headers = precompile_public_haders == 'Auto'
+        auto_precompile_private_headers = precompile_private_haders == 'Auto'
+        auto_external_headers = []
+        auto_local_headers = []
+        if auto_precompile_public_headers or auto_precompile_private_headers:
+            scanned_file_paths = source_file_paths + include_file_paths + private_include_file_paths
+            auto_external_headers, auto_local_headers = self.get_auto_precompiled_headers(scanned_file_paths, [package_header_file_name, precompiled_header_file_name])
 
         def write_include(stream, path, local=True):
             relpath = os.path.relpath(path, start=f'{self.target_dir}/{include_base_dir}') if local else path
@@ -219,43 +563,79 @@ class TargetGenerator(ConanFile):
             stream.write('\n')
 
         stream = io.StringIO()
-        with open(package_header_file_name, 'w') as f:
-            stream.write('#pragma once\n\n')
+        stream.write('#pragma once\n\n')
+        for key, value in self.target.get('PublicDefines', {}).items():
+            stream.write(f"#define {key} {value}\n")
+        write_includes(stream, self.target.get('PublicIncludes', []), False)
+
+        write_includes(stream, include_file_paths)
+        write_includes(stream, inline_include_file_paths)
+        self.save_file(package_header_file_path, stream.getvalue())
+
+        stream = io.StringIO()
+        stream.write('#pragma once\n\n')
+        for key, value in self.target.get('PrivateDefines', {}).items():
+            stream.write(f"#define {key} {value}\n")
+        if not precompile_public_haders or auto_precompile_public_headers:
             for key, value in self.target.get('PublicDefines', {}).items():
                 stream.write(f"#define {key} {value}\n")
+
+        write_includes(stream, self.target.get('PrivateIncludes', []), False)
+
+        if precompile_public_haders and not auto_precompile_public_headers:
+            write_include(stream, package_header_file_name, False)
+        else:
             write_includes(stream, self.target.get('PublicIncludes', []), False)
-            
-            write_includes(stream, include_file_paths)
-            write_includes(stream, inline_include_file_paths)
-        self.save_file(package_header_file_name, stream.getvalue())
 
-        stream = io.StringIO()
-        with open(precompiled_header_file_name, 'w') as f:
-            stream.write('#pragma once\n\n')
-            for key, value in self.target.get('PrivateDefines', {}).items():
-                stream.write(f"#define {key} {value}\n")
-            if not precompile_public_haders:
-                for key, value in self.target.get('PublicDefines', {}).items():
-                    stream.write(f"#define {key} {value}\n")
-            
-            write_includes(stream, self.target.get('PrivateIncludes', []), False)
-
-            if precompile_public_haders:
-                write_include(stream, package_header_file_name, False)
-            else:
-                write_includes(stream, self.target.get('PublicIncludes', []), False)
-            
-            if precompile_private_haders:
-                write_includes(stream, private_include_file_paths)
-                write_includes(stream, private_inline_include_file_paths)
-        self.save_file(precompiled_header_file_name, stream.getvalue())
-
-        cmake_sources = ' '.join(source_file_paths)
+        if auto_external_headers:
+            write_includes(stream, auto_external_headers, False)
+
+        auto_dependency_headers = [path for path in auto_local_headers if path not in include_file_paths and path not in private_include_file_paths]
+        if auto_dependency_headers:
+            write_includes(stream, auto_dependency_headers)
+
+        if auto_precompile_public_headers:
+            write_includes(stream, [path for path in include_file_paths if path in auto_local_headers])
+
+        if auto_precompile_private_headers:
+            write_includes(stream, [path for path in private_include_file_paths if path in auto_local_headers])
+        elif precompile_private_haders:
+            write_includes(stream, private_include_file_paths)
+            write_includes(stream, private_inline_include_file_paths)
+        precompiled_header_content = stream.getvalue()
+        self.save_file(precompiled_header_file_path, precompiled_header_content)
+
         target_type = self.target.get('Type', 'Application')
-        interface = False
-        if target_type == 'Application':
-            cmake_content.append(f'add_executable({cmake_target_name} {cmake_sources})')
+        module_scan_file_paths = public_module_source_file_paths + private_module_source_file_paths + source_file_paths
+        if self.target.get('UnityBuild', False) and target_type in ['Application', 'Library', 'Plugin']:
+            source_file_paths = self.generate_unity_sources(cmake_target_name, source_file_paths)
+
+        # Lists that change often live in their own files so a new source only rewrites the fragment that holds it
+        cmake_fragments = {}
+        def add_fragment(name, lines):
+            cmake_fragments[name] = lines
+            cmake_content.append(f'include(${{CMAKE_CURRENT_LIST_DIR}}/CMake/{name}.cmake)')
+
+        def get_path_list(paths):
+            return ''.join(f'\n    {path}' for path in paths)
 
+        interface = False
+        if target_type == 'Interface':
+            interface = True
+            cmake_content.append(f'add_library({cmake_target_name} INTERFACE)')
+        else:
+            add_fragment('Sources', [f'set({cmake_target_name}_SOURCES{get_path_list(source_file_paths)}\n)'])
+            if target_type == 'Application':
+                cmake_content.append(f'add_executable({cmake_target_name} ${{{cmake_target_name}_SOURCES}})')
+            elif target_type == 'Library' or target_type == 'Plugin':
+                cmake_content.append(f'add_library({cmake_target_name} ${{{cmake_target_name}_SOURCES}})')
+
+        if target_type in ['Application', 'Library', 'Plugin']:
+            module_file_paths = public_module_source_file_paths + private_module_source_file_paths
+            exported_modules, imported_modules = self.scan_modules(module_scan_file_paths)
+            registry = self.register_modules(exported_modules)
+
+            module_content = []
             def write_modules(access, paths):
                 if not paths:
                     return
@@ -265,72 +645,143 @@ class TargetGenerator(ConanFile):
                     dir = os.path.dirname(path)
                     if dir not in cmake_module_dirs:
                         cmake_module_dirs.append(dir)
-                cmake_module_dirs = 'BASE_DIRS ' + ' '.join(cmake_module_dirs) if len(cmake_module_dirs) else ''
 
-                cmake_module_sources = 'FILES ' + ' '.join(paths)
-                cmake_content.append(f'target_sources({cmake_target_name} {access} FILE_SET cxx_modules TYPE CXX_MODULES {cmake_module_dirs} {cmake_module_sources})')
+                module_content.append(f'target_sources({cmake_target_name} {access} FILE_SET cxx_modules TYPE CXX_MODULES\n'
+                    f'    BASE_DIRS{get_path_list(cmake_module_dirs)}\n'
+                    f'    FILES{get_path_list(paths)}\n)')
 
             write_modules('PUBLIC', public_module_source_file_paths)
             write_modules('PRIVATE', private_module_source_file_paths)
-        elif target_type == 'Library' or target_type == 'Plugin':
-            cmake_content.append(f'add_library({cmake_target_name} {cmake_sources})')
-        elif target_type == 'Interface':
-            interface = True
-            cmake_content.append(f'add_library({cmake_target_name} INTERFACE)')
 
-        public_keyword = 'INTERFACE' if interface else 'PUBLIC'
+            # Module units can't be compiled with a precompiled header, the other sources keep it
+            if module_file_paths:
+                module_content.append(f'set_source_files_properties({get_path_list(module_file_paths)}\n    PROPERTIES SKIP_PRECOMPILE_HEADERS ON\n)')
 
-        if not interface:
-            cmake_content.append(f'target_compile_definitions({cmake_target_name} PRIVATE -D_WIN32_WINNT=0x0601)')
-            if not public_module_source_file_paths and not private_module_source_file_paths:
-                cmake_content.append(f'target_precompile_headers({cmake_target_name} PRIVATE {precompiled_header_file_name})')
+            module_content.extend(self.get_module_reuse_commands(cmake_target_name, imported_modules, registry))
+            add_fragment('Modules', module_content)
+
+        public_keyword = 'INTERFACE' if interface else 'PUBLIC'
 
         if cmake_link_packages:
-            packages = ' '.join(cmake_link_packages)
             access_keyword = public_keyword
-            cmake_content.append(f'target_link_libraries({cmake_target_name} {access_keyword} {packages})')
+            add_fragment('Link', [f'target_link_libraries({cmake_target_name} {access_keyword}{get_path_list(cmake_link_packages)}\n)'])
+
+        if not interface:
+            add_fragment('JobPools', self.get_job_pool_commands(cmake_target_name))
+
+        properties_content = []
+        if not interface:
+            properties_content.append(f'target_compile_definitions({cmake_target_name} PRIVATE -D_WIN32_WINNT=0x0601)')
+            properties_content.extend(self.get_precompile_headers_commands(cmake_target_name, precompiled_header_file_name, precompiled_header_content))
 
         include_dir = os.path.relpath(os.path.join(self.target_dir, "Include"), start=script_folder)
         include_dir = PureWindowsPath((os.path.normpath(include_dir))).as_posix()
-        cmake_content.append(f'target_include_directories({cmake_target_name} {public_keyword} . {include_dir})')
+        properties_content.append(f'target_include_directories({cmake_target_name} {public_keyword} . {include_dir})')
 
         if not interface:
             source_dir = os.path.relpath(os.path.join(self.target_dir, "Source"), start=script_folder)
             source_dir = PureWindowsPath((os.path.normpath(source_dir))).as_posix()
-            cmake_content.append(f'target_include_directories({cmake_target_name} PRIVATE {source_dir})')
+            properties_content.append(f'target_include_directories({cmake_target_name} PRIVATE {source_dir})')
 
-        cmake_content.append(f'set_target_properties({cmake_target_name} PROPERTIES\n\tCXX_STANDARD 20\n\tCXX_STANDARD_REQUIRED YES\n\tCXX_EXTENSIONS NO\n)')
+        properties_content.append(f'set_target_properties({cmake_target_name} PROPERTIES\n\tCXX_STANDARD 20\n\tCXX_STANDARD_REQUIRED YES\n\tCXX_EXTENSIONS NO\n)')
+        add_fragment('Properties', properties_content)
         cmake_content.append('set(CMAKE_VERBOSE_MAKEFILE ON)')
 
+        for name, lines in cmake_fragments.items():
+            self.save_file(os.path.join(script_folder, 'CMake', f'{name}.cmake'), '\n'.join(lines) + '\n')
+
+        # Fragments left over from an earlier target type would otherwise count as configure inputs
+        for path in glob.glob(os.path.join(script_folder, 'CMake', '*.cmake')):
+            if os.path.splitext(os.path.basename(path))[0] not in cmake_fragments:
+                os.remove(path)
+
         cmake_content = '\n'.join(cmake_content)
 
         print(cmake_content)
 
         self.save_file(cmake_project_path, cmake_content)
 
-        cmake = CMake(self)
-        cmake.configure(build_script_folder=self.folders.build_folder)
-
-        bat_files = glob.glob("conanrunenv-*.bat")
-
-        for bat_file in bat_files:
-            with open(bat_file, "r") as f:
-                lines = f.readlines()
-
-            path_line = '\n'
-            for line in lines:
-                if line.startswith('set "PATH='):
-                    path_line = line.strip()[5:-2]
-                    break
-
-            with open("conanrun.env", "w") as f:
-                f.write(path_line)
-
+    def get_job_pool_setting(self, key):
+        return self.target.get(key, self.project.get(key, None))
+
+    def get_job_pool_commands(self, cmake_target_name):
+        # Sizes are measured by CMake at configure time so the generated files stay the same on every machine,
+        # the BUILD_TOOLS_*_JOBS cache variables override them from the command line
+        compile_jobs = self.get_job_pool_setting('CompileJobs')
+        link_jobs = self.get_job_pool_setting('LinkJobs')
+        link_job_memory = self.get_job_pool_setting('LinkJobMemory') or 2048
+
+        lines = [
+            'cmake_host_system_information(RESULT BUILD_TOOLS_CORES QUERY NUMBER_OF_LOGICAL_CORES)',
+            'cmake_host_system_information(RESULT BUILD_TOOLS_MEMORY QUERY AVAILABLE_PHYSICAL_MEMORY)',
+            'if(NOT BUILD_TOOLS_COMPILE_JOBS)',
+            f'    set(BUILD_TOOLS_COMPILE_JOBS {compile_jobs or "${BUILD_TOOLS_CORES}"})',
+            'endif()',
+            'if(NOT BUILD_TOOLS_LINK_JOBS)',
+        ]
+        if link_jobs:
+            lines.append(f'    set(BUILD_TOOLS_LINK_JOBS {link_jobs})')
+        else:
+            lines.extend([
+                f'    math(EXPR BUILD_TOOLS_LINK_JOBS "${{BUILD_TOOLS_MEMORY}} / {link_job_memory}")',
+                '    if(BUILD_TOOLS_LINK_JOBS GREATER BUILD_TOOLS_CORES)',
+                '        set(BUILD_TOOLS_LINK_JOBS ${BUILD_TOOLS_CORES})',
+                '    endif()',
+            ])
+        lines.extend([
+            'endif()',
+            'if(BUILD_TOOLS_LINK_JOBS LESS 1)',
+            '    set(BUILD_TOOLS_LINK_JOBS 1)',
+            'endif()',
+            'set_property(GLOBAL APPEND PROPERTY JOB_POOLS compile_pool=${BUILD_TOOLS_COMPILE_JOBS} link_pool=${BUILD_TOOLS_LINK_JOBS})',
+            f'set_target_properties({cmake_target_name} PROPERTIES JOB_POOL_COMPILE compile_pool JOB_POOL_LINK link_pool)',
+        ])
+        return lines
+
+    def get_configure_fingerprint(self):
+        # CMake regenerates its build system by itself when these change, a configure is only needed for a new cache
+        paths = [os.path.join(script_folder, name) for name in ['build_info.yaml', 'CMakeLists.txt', 'CMakePresets.json']]
+        paths.extend(sorted(glob.glob(os.path.join(script_folder, 'CMake', '*.cmake'))))
+        paths.extend(path for path in sorted(glob.glob(os.path.join(script_folder, '*.cmake'))) if os.path.basename(path) not in ['cmake_install.cmake', 'CTestTestfile.cmake'])
+
+        fingerprint = hashlib.sha256()
+        for path in paths:
+            fingerprint.update(path.encode())
+            if os.path.isfile(path):
+                with open(path, 'rb') as f:
+                    fingerprint.update(f.read())
+        return fingerprint.hexdigest()
+
+    def is_configured(self):
+        if not os.path.isfile(os.path.join(script_folder, 'CMakeCache.txt')):
+            return False
+
+        fingerprint_path = os.path.join(script_folder, 'configure_fingerprint.txt')
+        if not os.path.isfile(fingerprint_path):
+            return False
+        with open(fingerprint_path, 'r') as f:
+            return f.read() == self.get_configure_fingerprint()
+
+    def save_configure_fingerprint(self):
+        build_utils.save_file(os.path.join(script_folder, 'configure_fingerprint.txt'), self.get_configure_fingerprint())
+
+    def configure_cmake(self):
+        if self.is_configured():
+            self.output.info('CMake configure skipped, inputs are unchanged')
+            return
+
+        with build_utils.trace_phase('CMake Configure'):
+            cmake = CMake(self)
+            cmake.configure(build_script_folder=self.folders.build_folder)
+        self.save_configure_fingerprint()
+
+    @build_utils.traced('Hook: build')
     def build(self):
+        self.configure_cmake()
         cmake = CMake(self)
-        cmake.configure(build_script_folder=self.folders.build_folder)
         cmake.build()
 
+    @build_utils.traced('Hook: package_info')
     def package_info(self):
         self.cpp_info.includedirs = ['.', os.path.relpath(os.path.join(self.target_dir, 'Include'), start=script_folder)]
 
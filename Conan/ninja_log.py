@@ -0,0 +1,150 @@
+import os
+import json
+
+pch_markers = ['cmake_pch', '.pch', '.gch']
+module_markers = ['.ifc', '.pcm', '.gcm', '.ddi', '.modmap', 'CXXDependInfo', 'CXXModules']
+link_extensions = ['.exe', '.dll', '.so', '.dylib', '.a', '.lib']
+
+class Step:
+
+    def __init__(self, start, end, outputs):
+        self.start = start
+        self.end = end
+        self.outputs = outputs
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+    @property
+    def name(self):
+        return self.outputs[0]
+
+    @property
+    def kind(self):
+        if any(marker in output for output in self.outputs for marker in pch_markers):
+            return 'PCH'
+        if any(marker in output for output in self.outputs for marker in module_markers):
+            return 'Module'
+        if any(os.path.splitext(output)[1] in link_extensions or '.so.' in output for output in self.outputs):
+            return 'Link'
+        if any(output.endswith('.o') or output.endswith('.obj') for output in self.outputs):
+            return 'Compile'
+        return 'Other'
+
+def read_steps(path):
+    entries = []
+    with open(path, 'r') as f:
+        header = f.readline()
+        if not header.startswith('# ninja log v'):
+            raise RuntimeError(f'Unsupported ninja log: {path}')
+
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) < 5:
+                continue
+            entries.append((int(fields[0]), int(fields[1]), fields[3], fields[4]))
+
+    # Ninja appends every build to the log, the last build starts where the end times stop increasing
+    last_build_start = 0
+    last_end = 0
+    for index, (start, end, output, command_hash) in enumerate(entries):
+        if end < last_end:
+            last_build_start = index
+        last_end = end
+
+    steps = {}
+    for start, end, output, command_hash in entries[last_build_start:]:
+        key = (start, end, command_hash)
+        if key in steps:
+            steps[key].outputs.append(output)
+        else:
+            steps[key] = Step(start, end, [output])
+
+    return sorted(steps.values(), key=lambda step: (step.start, step.end))
+
+def get_critical_path(steps):
+    if not steps:
+        return []
+
+    # Without the dependency graph the chain is estimated by walking back from the last finished step
+    # to the step that finished last before it started
+    path = [max(steps, key=lambda step: step.end)]
+    while True:
+        previous_steps = [step for step in steps if step.end <= path[-1].start and step.start < path[-1].start]
+        if not previous_steps:
+            break
+        path.append(max(previous_steps, key=lambda step: step.end))
+
+    return list(reversed(path))
+
+def get_trace_events(steps):
+    lanes = []
+    events = []
+    for step in steps:
+        lane = next((index for index, lane_end in enumerate(lanes) if lane_end <= step.start), None)
+        if lane is None:
+            lane = len(lanes)
+            lanes.append(0)
+        lanes[lane] = step.end
+
+        events.append({
+            'name': step.name,
+            'cat': step.kind,
+            'ph': 'X',
+            'ts': step.start * 1000,
+            'dur': step.duration * 1000,
+            'pid': 0,
+            'tid': lane,
+            'args': { 'outputs': step.outputs },
+        })
+    return events
+
+def report(build_dir, count=20, trace_path=None):
+    log_path = os.path.join(build_dir, '.ninja_log')
+    if not os.path.isfile(log_path):
+        raise RuntimeError(f'No ninja log found in {build_dir}, build the target with the Ninja generator first.')
+
+    steps = read_steps(log_path)
+    if not steps:
+        print('No build steps recorded.')
+        return
+
+    wall_time = max(step.end for step in steps) - min(step.start for step in steps)
+    total_time = sum(step.duration for step in steps)
+    critical_path = get_critical_path(steps)
+
+    print(f'Steps: {len(steps)}')
+    print(f'Wall time: {wall_time / 1000:.2f}s')
+    print(f'Total step time: {total_time / 1000:.2f}s')
+    print(f'Parallelism: {total_time / wall_time if wall_time else 1.0:.2f}')
+    print(f'Critical path (estimated): {sum(step.duration for step in critical_path) / 1000:.2f}s in {len(critical_path)} steps')
+
+    kinds = {}
+    for step in steps:
+        kinds.setdefault(step.kind, []).append(step)
+
+    print()
+    for kind, kind_steps in sorted(kinds.items()):
+        print(f'{kind}: {len(kind_steps)} steps, {sum(step.duration for step in kind_steps) / 1000:.2f}s')
+
+    for kind in ['Compile', 'Link', 'PCH', 'Module']:
+        kind_steps = sorted(kinds.get(kind, []), key=lambda step: -step.duration)[:count]
+        if not kind_steps:
+            continue
+
+        print()
+        print(f'Slowest {kind} steps:')
+        for step in kind_steps:
+            print(f'  {step.duration / 1000:8.2f}s  {step.name}')
+
+    print()
+    print('Critical path:')
+    for step in critical_path:
+        print(f'  {step.duration / 1000:8.2f}s  {step.name}')
+
+    if trace_path:
+        with open(trace_path, 'w') as f:
+            json.dump({ 'traceEvents': get_trace_events(steps), 'displayTimeUnit': 'ms' }, f)
+        print()
+        print(f'Trace: {trace_path}')
@@ -0,0 +1,118 @@
+import os
+import json
+import fnmatch
+import zipfile
+
+from concurrent.futures import ThreadPoolExecutor
+
+import artifact_cache
+import build_utils
+
+excluded_patterns = ['cmake_pch*', '*.ifc', '*.pcm', '*.gcm', '*.bmi', '*.exp']
+shared_library_patterns = ['*.dll', '*.so', '*.so.*', '*.dylib']
+
+def is_shared_library(file_name):
+    return any(fnmatch.fnmatch(file_name, pattern) for pattern in shared_library_patterns)
+
+def get_run_environment_dirs(build_dir, configuration):
+    dirs = []
+    for name, value in build_utils.load_run_environment(build_dir, configuration).items():
+        if name not in build_utils.run_path_variables:
+            continue
+        for path in value.split(os.pathsep):
+            if path and '${' not in path and path not in dirs:
+                dirs.append(path)
+    return dirs
+
+def collect_target_files(build_dir, target_name, configuration, other_configurations=[]):
+    files = {}
+    for relpath in artifact_cache.find_artifacts(build_dir, target_name, other_configurations):
+        file_name = os.path.basename(relpath)
+        if not any(fnmatch.fnmatch(file_name, pattern) for pattern in excluded_patterns):
+            files[file_name] = os.path.join(build_dir, relpath)
+
+    # Runtime libraries of the dependencies come from the folders the Conan run environment adds
+    for path in get_run_environment_dirs(build_dir, configuration):
+        if not os.path.isdir(path) or os.path.samefile(path, build_dir):
+            continue
+        for file_name in sorted(os.listdir(path)):
+            file_path = os.path.join(path, file_name)
+            if is_shared_library(file_name) and os.path.isfile(file_path):
+                files.setdefault(file_name, file_path)
+    return files
+
+def write_archive(archive_path, files):
+    temp_path = f'{archive_path}.{os.getpid()}.tmp'
+    with zipfile.ZipFile(temp_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for arcname, path in sorted(files.items()):
+            archive.write(path, arcname)
+    os.replace(temp_path, archive_path)
+
+class Packager:
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.manifest_path = os.path.join(output_dir, 'manifest.json')
+        self.manifest = build_utils.read_json(self.manifest_path, {})
+        self.hash_cache = build_utils.FileInfoCache(os.path.join(output_dir, '.hashes.json'))
+
+    def get_hashes(self, files):
+        return { arcname: self.hash_cache.get(path, artifact_cache.get_file_hash) for arcname, path in files.items() }
+
+    def is_up_to_date(self, name, hashes):
+        entry = self.manifest.get('Archives', {}).get(name)
+        return entry and entry['Files'] == hashes and os.path.isfile(os.path.join(self.output_dir, entry['Archive']))
+
+    def package(self, target_files, jobs):
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            target_hashes = dict(zip(target_files, executor.map(self.get_hashes, target_files.values())))
+        self.hash_cache.save()
+
+        # A shared library with the same name and content in several targets is stored once in Shared.zip
+        owners = {}
+        for target_name, hashes in target_hashes.items():
+            for arcname, file_hash in hashes.items():
+                if is_shared_library(arcname):
+                    owners.setdefault(arcname, {}).setdefault(file_hash, []).append(target_name)
+
+        shared_files = {}
+        shared_hashes = {}
+        for arcname, hash_owners in owners.items():
+            if len(hash_owners) == 1:
+                file_hash, target_names = next(iter(hash_owners.items()))
+                if len(target_names) > 1:
+                    shared_files[arcname] = target_files[target_names[0]][arcname]
+                    shared_hashes[arcname] = file_hash
+
+        archives = {}
+        for target_name, files in target_files.items():
+            archive_files = { arcname: path for arcname, path in files.items() if arcname not in shared_files }
+            archive_hashes = { arcname: file_hash for arcname, file_hash in target_hashes[target_name].items() if arcname not in shared_files }
+            shared = sorted(arcname for arcname in files if arcname in shared_files)
+            archives[target_name] = (archive_files, archive_hashes, shared)
+        if shared_files:
+            archives['Shared'] = (shared_files, shared_hashes, [])
+
+        def package_archive(name):
+            archive_files, archive_hashes, shared = archives[name]
+            archive_name = f'{os.path.basename(name)}.zip'
+            if self.is_up_to_date(name, archive_hashes):
+                print(f'Unchanged: {archive_name}', flush=True)
+            else:
+                write_archive(os.path.join(self.output_dir, archive_name), archive_files)
+                print(f'Packaged: {archive_name} ({len(archive_files)} files)', flush=True)
+            return { 'Archive': archive_name, 'Files': archive_hashes, 'Shared': shared }
+
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            entries = dict(zip(archives, executor.map(package_archive, archives)))
+
+        for name, entry in self.manifest.get('Archives', {}).items():
+            archive_path = os.path.join(self.output_dir, entry['Archive'])
+            if name not in entries and os.path.isfile(archive_path):
+                print(f'Remove: {entry["Archive"]}')
+                os.remove(archive_path)
+
+        self.manifest['Archives'] = entries
+        build_utils.save_file(self.manifest_path, json.dumps(self.manifest, indent=4))
@@ -2,14 +2,31 @@ import argparse
 import yaml
 import json
 import os
-import shutil
-import subprocess
+import fnmatch
 import glob
+import subprocess
+import importlib.util
+import sys
+import threading
+import hashlib
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 from pathlib import PureWindowsPath
 
+import artifact_cache
+import build_utils
+import ninja_log
+import package_archives
+import watch
+
 script_folder = os.path.dirname(os.path.abspath(__file__))
 
+dependency_file_patterns = ['*.cmake', 'conanbuild*', 'conanrun*', 'deactivate_*']
+dependency_file_exclude_patterns = ['cmake_install.cmake', 'CTestTestfile.cmake', 'conanrun.env']
+generator_lock = threading.Lock()
+conan_lock = threading.Lock()
+
 def get_tools_path():
     return PureWindowsPath((os.path.normpath(os.path.join(script_folder, "..", "Tools.bat")))).as_posix()
 
@@ -20,25 +37,92 @@ class ProjectTools:
         self.project_name = os.path.basename(self.project_dir) + ".project"
         self.project_path = os.path.join(self.project_dir, self.project_name)
 
+        if getattr(args, 'Trace', False):
+            os.environ['BUILD_TOOLS_TRACE'] = '1'
+        if getattr(args, 'Profile', False):
+            os.environ['BUILD_TOOLS_PROFILE'] = '1'
+        build_utils.start_trace('tools', self.project_dir)
+
         self.configuration = args.Configuration
-        self.target = args.Target
 
-        self.build_dir = os.path.join(self.project_dir, '.Build', self.configuration, self.target)
+        project = build_utils.load_yaml(self.project_path, self.descriptor_cache_dir) if os.path.isfile(self.project_path) else {}
+        self.multi_config = getattr(args, 'MultiConfig', False) or project.get('MultiConfig', False)
+        self.configurations = list(project.get('Configurations', ['Debug', 'Release']))
+        if self.configuration not in self.configurations:
+            self.configurations.append(self.configuration)
+        self.target = getattr(args, 'Target', None)
+        self.project = {}
+        self.targets = []
+        self.target_files = {}
+        self.build_jobs = None
+        self.use_artifact_cache = False
+        self.link_jobs = getattr(args, 'LinkJobs', None)
+        self.artifact_graph = None
+        self.artifact_keys = {}
+        self.artifact_lock = threading.Lock()
+
+        if self.target:
+            self.build_dir = self.get_build_dir(self.target)
+
+        if getattr(args, 'UpdatePrecompiledHeaders', False):
+            os.environ['BUILD_TOOLS_UPDATE_PCH'] = '1'
 
         if args.Command == "Generate":
-            print(f"Create build directory: {self.build_dir}")
-            os.makedirs(self.build_dir, exist_ok=True)
-            
             self.generator = args.Generator
+            self.force = args.Force or args.UpdatePrecompiledHeaders
             self.generate()
+        elif args.Command == "GenerateAll":
+            self.generator = args.Generator
+            self.force = args.Force or args.UpdatePrecompiledHeaders
+            self.generate_all(args.Jobs)
         elif args.Command == "Build":
+            self.build_jobs = args.Jobs
+            self.use_artifact_cache = not args.NoCache
             self.build()
+            if args.Timings:
+                self.report()
+        elif args.Command == "BuildAll":
+            self.use_artifact_cache = not args.NoCache
+            self.build_all(args.Jobs)
+        elif args.Command == "Affected":
+            self.use_artifact_cache = args.Build and not args.NoCache
+            self.affected(args.Paths, args.Diff, args.Build, args.Jobs)
+        elif args.Command == "Run":
+            self.run_executable(args.Arguments)
+        elif args.Command == "Watch":
+            self.watch(args.Interval, args.Polling)
+        elif args.Command == "Report":
+            self.report(args.Count)
         elif args.Command == "Package":
-            self.package()
+            self.package(args.Output, args.Jobs)
         else:
             return False
         return True
 
+    def get_build_root(self):
+        # A multi-config build tree holds every configuration, so it is shared instead of living under one of them
+        return os.path.join(self.project_dir, '.Build', 'MultiConfig' if self.multi_config else self.configuration)
+
+    def get_build_dir(self, target_name):
+        return os.path.join(self.get_build_root(), target_name)
+
+    @property
+    def cmake_generator(self):
+        if self.generator:
+            return self.generator
+        return 'Ninja Multi-Config' if self.multi_config else None
+
+    def run_process(self, args, cwd, log=print, env=None):
+        log(*args)
+        with build_utils.trace_phase(f'Process: {" ".join(args[:2])}'):
+            if log is print:
+                subprocess.run(args, cwd=cwd, check=True, env=env)
+                return
+
+            result = subprocess.run(args, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, env=env)
+        log(result.stdout.rstrip())
+        result.check_returncode()
+
     def read_json_with_comments(self, path):
         data = {}
         if os.path.exists(path):
@@ -49,87 +133,83 @@ class ProjectTools:
 
         return data
 
-    def generate_vscode_tasks(self, project, path):
+    def merge_vscode_entries(self, path, list_key, key, defaults, entries):
+        # Entries are only merged when their values changed or the file was edited since the last merge
+        state_path = os.path.join(build_utils.get_cache_dir(self.project_dir, 'VSCode'), os.path.basename(path) + '.json')
+        state = build_utils.read_json(state_path, {})
+        signatures = { label: hashlib.sha1(json.dumps(values, sort_keys=True).encode()).hexdigest() for label, values in entries.items() }
+
+        file_mtime = build_utils.get_mtime(path)
+        if state.get('Mtime') == file_mtime and file_mtime is not None:
+            changed_labels = [label for label, signature in signatures.items() if state.get('Entries', {}).get(label) != signature]
+            if not changed_labels:
+                return
+        else:
+            changed_labels = list(signatures)
+
         data = self.read_json_with_comments(path)
-        if 'version' not in data:
-            data['version'] = '2.0.0'
-        if 'tasks' not in data:
-            data['tasks'] = []
+        for name, value in defaults.items():
+            data.setdefault(name, value)
+
+        index = { entry.get(key, None): entry for entry in data[list_key] }
+        for label in changed_labels:
+            entry = index.get(label)
+            if entry is None:
+                entry = { key: label }
+                data[list_key].append(entry)
+                index[label] = entry
+            entry.update(entries[label])
+
+        if build_utils.save_file(path, json.dumps(data, indent=4)):
+            print(f"Write: {path}")
+        build_utils.save_file(state_path, json.dumps({ 'Mtime': build_utils.get_mtime(path), 'Entries': signatures }, indent=4))
 
+    @build_utils.traced('Generate VS Code Tasks')
+    def generate_vscode_tasks(self, project, path):
+        multi_config_args = ["--MultiConfig"] if self.multi_config else []
+
+        entries = {}
         for target in self.targets:
             target_name = target['Name']
             target_short_name = os.path.basename(target_name)
 
             generate_task_name = f'G: {target_short_name}'
-            generate_task = None
-            for c in data['tasks']:
-                if c.get('label', None) == generate_task_name:
-                    generate_task = c
-                    break
-
-            if generate_task == None:
-                data['tasks'].append({'label': generate_task_name})
-                generate_task = data['tasks'][-1]
-
-            generate_task.update({
+            entries[generate_task_name] = {
                 "label": generate_task_name,
                 "type": "shell",
                 "command": get_tools_path(),
-                "args": ["Generate", f"--Target={target_name}", f"--Configuration={self.configuration}", f"--Generator=Ninja"]
-            })
+                "args": ["Generate", f"--Target={target_name}", f"--Configuration={self.configuration}", f"--Generator={self.cmake_generator or 'Ninja'}"] + multi_config_args
+            }
 
             if target.get('Type', None) != 'Interface':
                 build_task_name = f'B: {target_short_name}'
-                build_task = None
-                for c in data['tasks']:
-                    if c.get('label', None) == build_task_name:
-                        build_task = c
-                        break
-
-                if build_task == None:
-                    data['tasks'].append({'label': build_task_name})
-                    build_task = data['tasks'][-1]
-
-                build_task.update({
+                entries[build_task_name] = {
                     "label": build_task_name,
                     "type": "shell",
                     "command": get_tools_path(),
-                    "args": ["Build", f"--Target={target_name}", f"--Configuration={self.configuration}"]
-                })
+                    "args": ["Build", f"--Target={target_name}", f"--Configuration={self.configuration}"] + multi_config_args
+                }
 
-        with open(path, 'w') as f:
-            json.dump(data, f, indent=4)
+        self.merge_vscode_entries(path, 'tasks', 'label', { 'version': '2.0.0', 'tasks': [] }, entries)
 
+    @build_utils.traced('Generate VS Code Configurations')
     def generate_vscode_configurations(self, project, path):
-        data = self.read_json_with_comments(path)
-        if 'version' not in data:
-            data['version'] = '0.2.0'
-        if 'configurations' not in data:
-            data['configurations'] = []
-
+        entries = {}
         for target in self.targets:
             target_name = target['Name']
             configuration_name = target_name
             if target.get('Type', 'Application') != 'Application':
                 continue
 
-            configuration = None
-            for c in data['configurations']:
-                if c.get('name', None) == configuration_name:
-                    configuration = c
-                    break
-
-            if configuration == None:
-                data['configurations'].append({'name': configuration_name})
-                configuration = data['configurations'][-1]
-
-            configuration.update({
+            build_dir = PureWindowsPath(os.path.relpath(self.get_build_dir(target_name), self.project_dir)).as_posix()
+            output_dir = f'{build_dir}/{self.configuration}' if self.multi_config else build_dir
+            entries[configuration_name] = {
                 "type": "cppvsdbg",
                 "request": "launch",
                 "preLaunchTask": f"B: {target_name}",
-                "program": '${workspaceFolder}' + f"/.Build/{self.configuration}/{target_name}/{os.path.basename(target_name)}.exe",
-                "envFile": '${workspaceFolder}' + f"/.Build/{self.configuration}/{target_name}/conanrun.env",
-                "symbolSearchPath": '${workspaceFolder}' + f"/.Build/{self.configuration}/{target_name}",
+                "program": '${workspaceFolder}' + f"/{output_dir}/{os.path.basename(target_name)}.exe",
+                "envFile": '${workspaceFolder}' + f"/{build_dir}/conanrun.env",
+                "symbolSearchPath": '${workspaceFolder}' + f"/{output_dir}",
                 "console": "internalConsole",
                 "logging": {
                     "moduleLoad": False,
@@ -137,75 +217,817 @@ class ProjectTools:
                 },
                 "internalConsoleOptions": "openOnSessionStart",
                 "visualizerFile": '${workspaceFolder}' + "/my.natvis"
-            })
+            }
+
+        self.merge_vscode_entries(path, 'configurations', 'name', { 'version': '0.2.0', 'configurations': [] }, entries)
+
+    @build_utils.traced('Merge Compile Commands')
+    def merge_compile_commands(self):
+        merged_path = os.path.join(self.project_dir, 'compile_commands.json')
+        cache_path = os.path.join(build_utils.get_cache_dir(self.project_dir, 'CompileCommands'), f'{os.path.basename(self.get_build_root())}.json')
+
+        with build_utils.FileLock(cache_path + '.lock'):
+            # The index only holds the mtime and command count per target, so a merge without changes only stats files
+            index = build_utils.read_json(cache_path, {})
+
+            entries = {}
+            changed_paths = set()
+            for target in self.targets:
+                path = os.path.join(self.get_build_dir(target['Name']), 'compile_commands.json')
+                mtime = build_utils.get_mtime(path)
+                if mtime is None:
+                    continue
+
+                entries[path] = { 'Mtime': mtime, 'Count': 0 }
+                if index.get(path, {}).get('Mtime') != mtime:
+                    changed_paths.add(path)
+
+            if not changed_paths and entries.keys() == index.keys() and os.path.isfile(merged_path):
+                return
+
+            # The merged file holds the targets in index order, so unchanged targets are sliced out of it
+            merged = build_utils.read_json(merged_path, [])
+            if sum(entry.get('Count', 0) for entry in index.values()) != len(merged):
+                index = {}
+                changed_paths = set(entries)
+
+            commands_by_path = {}
+            offset = 0
+            for path in sorted(index):
+                count = index[path].get('Count', 0)
+                commands_by_path[path] = merged[offset:offset + count]
+                offset += count
+
+            commands = []
+            for path in sorted(entries):
+                target_commands = build_utils.read_json(path, []) if path in changed_paths else commands_by_path[path]
+                entries[path]['Count'] = len(target_commands)
+                commands.extend(target_commands)
+
+            if build_utils.save_file(merged_path, json.dumps(commands, indent=2)):
+                print(f"Write: {merged_path} ({len(commands)} commands)")
+            build_utils.save_file(cache_path, json.dumps(entries))
+
+    def load_targets(self, project):
+        targets = project.get('Targets', [])
+
+        self.target_files = build_utils.load_target_manifest(self.project_dir, project.get('IgnoreDirectories', []))
+        for target_name, target_path in self.target_files.items():
+            target = build_utils.load_yaml(os.path.join(self.project_dir, target_path), self.descriptor_cache_dir)
+            target['Name'] = target_name
+            targets.append(target)
+
+        return targets
+
+    @property
+    def descriptor_cache_dir(self):
+        return build_utils.get_cache_dir(self.project_dir, 'Descriptors')
+
+    @build_utils.traced('Load Project')
+    def load_project(self):
+        project = build_utils.load_yaml(self.project_path, self.descriptor_cache_dir)
 
-        with open(path, 'w') as f:
-            json.dump(data, f, indent=4)
+        self.project = project
+        self.targets = self.load_targets(project)
+        self.artifact_graph = None
+        self.artifact_keys = {}
+        return project
 
+    def find_target(self, target_name):
+        for target in self.targets:
+            if target['Name'] == target_name:
+                return target
+        return None
+
+    def get_dependency_name(self, dependency):
+        name = dependency['Name'] if isinstance(dependency, dict) else dependency
+        return name.split('/')[0]
+
+    def get_target_graph(self, precompiled_header_owners=True):
+        target_names = {os.path.basename(target['Name']): target['Name'] for target in self.targets}
+
+        graph = {}
+        for target in self.targets:
+            dependencies = set()
+            for key in ['LocalDependencies', 'PublicDependencies', 'PrivateDependencies']:
+                for dependency in target.get(key, []):
+                    dependency_name = target_names.get(self.get_dependency_name(dependency))
+                    if dependency_name and dependency_name != target['Name']:
+                        dependencies.add(dependency_name)
+
+            # A target that reuses another target's precompiled header or module interfaces is built after it
+            owner_target_names = self.get_module_owners(target['Name'])
+            if precompiled_header_owners:
+                owner_target_names.append(self.get_precompiled_header_owner(target['Name']))
+            for owner_target_name in owner_target_names:
+                if owner_target_name in target_names.values() and owner_target_name != target['Name']:
+                    dependencies.add(owner_target_name)
+            graph[target['Name']] = dependencies
+        return graph
+
+    def get_precompiled_header_owner(self, target_name):
+        return (self.read_text(os.path.join(self.get_build_dir(target_name), 'precompiled_header_owner.txt')) or '').strip() or None
+
+    def get_module_owners(self, target_name):
+        return (self.read_text(os.path.join(self.get_build_dir(target_name), 'module_owners.txt')) or '').split()
+
+    def is_precompiled_header_registered(self, target_name):
+        if not os.path.isfile(os.path.join(self.get_build_dir(target_name), 'precompiled_header_owner.txt')):
+            return True
+
+        # A target is regenerated when its entry was pruned, when the owner's header content changed or when the owner was removed
+        registry = build_utils.read_json(os.path.join(self.get_build_root(), 'PrecompiledHeaders.json'), {})
+        if target_name not in registry:
+            return False
+        owner_target_name = self.get_precompiled_header_owner(target_name)
+        if not owner_target_name:
+            return True
+        return self.find_target(owner_target_name) is not None and registry.get(owner_target_name) == registry[target_name]
+
+    def get_reverse_target_graph(self):
+        target_names = {os.path.basename(target['Name']): target['Name'] for target in self.targets}
+
+        dependents = {target['Name']: [] for target in self.targets}
+        for target in self.targets:
+            for key in ['LocalDependencies', 'PublicDependencies', 'PrivateDependencies']:
+                for dependency in target.get(key, []):
+                    dependency_name = target_names.get(self.get_dependency_name(dependency))
+                    if dependency_name and dependency_name != target['Name']:
+                        static = target.get('StaticLinkage', False) or (isinstance(dependency, dict) and bool(dependency.get('Static', False)))
+                        dependents[dependency_name].append((target['Name'], key != 'PrivateDependencies', static))
+        return dependents
+
+    def run_targets(self, action, jobs, target_names=None):
+        graph = self.get_target_graph()
+        if target_names is not None:
+            graph = {target_name: dependencies & target_names for target_name, dependencies in graph.items() if target_name in target_names}
+        pending = dict(graph)
+        running = {}
+        succeeded = set()
+        failed = {}
+
+        def run_target(target_name):
+            lines = [f'[{target_name}]']
+            try:
+                action(target_name, log=lambda *args: lines.append(' '.join(str(arg) for arg in args)))
+            finally:
+                print('\n'.join(lines), flush=True)
+
+        def schedule():
+            changed = True
+            while changed:
+                changed = False
+                for target_name, dependencies in list(pending.items()):
+                    failed_dependencies = dependencies & failed.keys()
+                    if failed_dependencies:
+                        failed[target_name] = f'Skipped, depends on {", ".join(sorted(failed_dependencies))}'
+                        del pending[target_name]
+                        changed = True
+                    elif dependencies <= succeeded:
+                        running[executor.submit(run_target, target_name)] = target_name
+                        del pending[target_name]
+
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            schedule()
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    target_name = running.pop(future)
+                    try:
+                        future.result()
+                        succeeded.add(target_name)
+                    except Exception as e:
+                        failed[target_name] = str(e)
+                schedule()
+
+        for target_name in pending:
+            failed[target_name] = 'Skipped, dependency cycle'
+
+        print(f'Succeeded: {len(succeeded)}, Failed: {len(failed)}')
+        for target_name, reason in sorted(failed.items()):
+            print(f'  {target_name}: {reason}')
+
+        if failed:
+            raise RuntimeError(f'{len(failed)} of {len(graph)} targets failed.')
+
+    @build_utils.traced('Generate VS Code Project')
     def generate_vscode_project(self, project_path):
         vscode_dir = os.path.join(os.path.dirname(project_path), '.vscode')
 
-        with open(project_path, 'r') as f:
-            project = yaml.load(f, Loader=yaml.FullLoader)
+        project = self.load_project()
 
-            self.targets = project.get('Targets', [])
+        for target in self.targets:
+            print('Target:', target['Name'])
 
-            target_files = glob.glob(os.path.join(self.project_dir, '**/*.target'), recursive=True)
-            for target_path in target_files:
-                with open(target_path, 'r') as f:
-                    target = yaml.load(f, Loader=yaml.FullLoader)
-                    target['Name'] = os.path.basename(os.path.dirname(target_path))
-                    self.targets.append(target)
-            
-            for target in self.targets:
-                print('Target:', target['Name'])
+        if not os.path.exists(vscode_dir):
+            os.makedirs(vscode_dir)
 
-            if not os.path.exists(vscode_dir):
-                os.makedirs(vscode_dir)
-            
-            self.generate_vscode_tasks(project, os.path.join(vscode_dir, 'tasks.json'))
-            self.generate_vscode_configurations(project, os.path.join(vscode_dir, 'launch.json'))
+        self.generate_vscode_tasks(project, os.path.join(vscode_dir, 'tasks.json'))
+        self.generate_vscode_configurations(project, os.path.join(vscode_dir, 'launch.json'))
 
     def generate(self):
         print("Generating...")
 
         self.generate_vscode_project(self.project_path)
+        self.generate_target(self.target)
+        self.merge_compile_commands()
+
+    def generate_all(self, jobs):
+        print("Generating all targets...")
+
+        self.generate_vscode_project(self.project_path)
+        self.lock_project()
+        try:
+            self.run_targets(self.generate_target, jobs)
+        finally:
+            self.merge_compile_commands()
+
+    def get_build_configurations(self):
+        return self.configurations if self.multi_config else [self.configuration]
+
+    def get_conan_profile_paths(self):
+        conan_home = os.environ.get('CONAN_HOME', os.path.join(os.path.expanduser('~'), '.conan2'))
+        return [os.path.join(conan_home, 'profiles', 'default'), os.path.join(conan_home, 'global.conf')]
+
+    def get_lockfile_path(self):
+        return os.path.join(self.get_build_root(), 'conan.lock')
+
+    def get_target_requires(self, target):
+        package_version = target.get('PackageVersion', self.project.get('Version', '1.0.0'))
+
+        requires = []
+        for key in ['LocalDependencies', 'PublicDependencies', 'PrivateDependencies', 'PrivateDependencyOverrides']:
+            for dependency in target.get(key, []):
+                dependency_name = (dependency['Name'] if isinstance(dependency, dict) else dependency).split('/')
+                package_name = dependency_name[0]
+                version = dependency_name[1] if len(dependency_name) > 1 else package_version
+                requires.append((key, f'{package_name}/{version}'))
+        return requires
+
+    @build_utils.traced('Lock Project')
+    def lock_project(self):
+        local_packages = {os.path.basename(target['Name']) for target in self.targets}
+
+        # Local targets are generated by this project, the lockfile pins only the external packages they share
+        references = {}
+        for target in self.targets:
+            for _, reference in self.get_target_requires(target):
+                package_name, version = reference.split('/', 1)
+                if package_name not in local_packages:
+                    references.setdefault(package_name, set()).add(version)
+
+        lockfile_path = self.get_lockfile_path()
+        conflicts = {name: versions for name, versions in references.items() if len(versions) > 1}
+        if conflicts:
+            print("Skip project lockfile, conflicting versions:", ', '.join(f'{name}: {sorted(versions)}' for name, versions in conflicts.items()))
+            if os.path.isfile(lockfile_path):
+                os.remove(lockfile_path)
+            return
+
+        requires = sorted(f'{name}/{versions.pop()}' for name, versions in references.items())
+        lock_inputs = hashlib.sha256('\n'.join(requires + self.get_build_configurations() + [str(self.cmake_generator)]).encode())
+        for path in self.get_conan_profile_paths():
+            if os.path.isfile(path):
+                with open(path, 'rb') as f:
+                    lock_inputs.update(f.read())
+        lock_inputs = lock_inputs.hexdigest()
+
+        lock_inputs_path = lockfile_path + '.inputs'
+        if os.path.isfile(lockfile_path) and os.path.isfile(lock_inputs_path):
+            with open(lock_inputs_path, 'r') as f:
+                if f.read() == lock_inputs:
+                    print(f"Lockfile is up to date: {lockfile_path}")
+                    return
+
+        if not requires:
+            return
+
+        os.makedirs(os.path.dirname(lockfile_path), exist_ok=True)
+        if os.path.isfile(lockfile_path):
+            os.remove(lockfile_path)
+
+        # Every configuration is added to the same lockfile
+        for configuration in self.get_build_configurations():
+            args = ["conan", "lock", "create", f"--settings=build_type={configuration}", f"--lockfile-out={lockfile_path}", "--build=missing"]
+            if os.path.isfile(lockfile_path):
+                args.append(f"--lockfile={lockfile_path}")
+            args.extend(f"--requires={reference}" for reference in requires)
+            try:
+                self.run_process(args, os.path.dirname(lockfile_path))
+            except subprocess.CalledProcessError as e:
+                print(f"Skip project lockfile: {e}")
+                if os.path.isfile(lockfile_path):
+                    os.remove(lockfile_path)
+                return
+
+        build_utils.save_file(lock_inputs_path, lock_inputs)
+
+    def get_dependency_key(self, target_name):
+        target = self.find_target(target_name) or {}
+
+        dependency_key = hashlib.sha256()
+        dependency_key.update(repr(sorted(self.get_target_requires(target))).encode())
+        for key in ['LocalDependencies', 'PublicDependencies', 'PrivateDependencies', 'PrivateDependencyOverrides', 'StaticLinkage']:
+            dependency_key.update(repr(target.get(key, None)).encode())
+        dependency_key.update(f'{self.get_build_configurations()}\n{self.cmake_generator}'.encode())
+        for path in self.get_conan_profile_paths() + [self.get_lockfile_path(), os.path.join(script_folder, 'conanfile.py')]:
+            if os.path.isfile(path):
+                with open(path, 'rb') as f:
+                    dependency_key.update(f.read())
+        return dependency_key.hexdigest()
+
+    def get_dependency_cache_dir(self, dependency_key):
+        return os.path.join(self.get_build_root(), '.Dependencies', dependency_key)
+
+    def is_dependency_file(self, file_name):
+        if any(fnmatch.fnmatch(file_name, pattern) for pattern in dependency_file_exclude_patterns):
+            return False
+        return any(fnmatch.fnmatch(file_name, pattern) for pattern in dependency_file_patterns)
+
+    def publish_dependency_files(self, build_dir, dependency_key):
+        cache_dir = self.get_dependency_cache_dir(dependency_key)
+        for file_name in os.listdir(build_dir):
+            if self.is_dependency_file(file_name):
+                build_utils.copy_file(os.path.join(build_dir, file_name), os.path.join(cache_dir, file_name))
+        build_utils.save_file(os.path.join(cache_dir, 'origin.txt'), build_dir)
+
+    def restore_dependency_files(self, build_dir, dependency_key, log=print):
+        cache_dir = self.get_dependency_cache_dir(dependency_key)
+        origin_path = os.path.join(cache_dir, 'origin.txt')
+        if not os.path.isfile(os.path.join(cache_dir, 'conan_toolchain.cmake')) or not os.path.isfile(origin_path):
+            return False
+
+        with open(origin_path, 'r') as f:
+            origin_dir = f.read()
+
+        log(f"Reuse dependencies from {cache_dir}")
+        for file_name in os.listdir(cache_dir):
+            if not self.is_dependency_file(file_name):
+                continue
+
+            # Environment scripts refer to the folder they were generated in
+            with open(os.path.join(cache_dir, file_name), 'rb') as f:
+                content = f.read()
+            for src, dst in [(origin_dir, build_dir), (PureWindowsPath(origin_dir).as_posix(), PureWindowsPath(build_dir).as_posix())]:
+                content = content.replace(src.encode(), dst.encode())
+            build_utils.save_file(os.path.join(build_dir, file_name), content)
+        return True
+
+    def configure_target(self, build_dir, log=print):
+        # Same steps as TargetGenerator.generate without resolving the dependency graph again
+        with generator_lock:
+            generator = self.load_generator(build_dir)
+        generator.generate_project()
+        generator.generate_run_environment()
+
+        args = ["cmake", "-S", build_dir, "-B", build_dir, "-DCMAKE_TOOLCHAIN_FILE=conan_toolchain.cmake", "-DCMAKE_POLICY_DEFAULT_CMP0091=NEW"]
+        if self.multi_config:
+            args.append(f"-DCMAKE_CONFIGURATION_TYPES={';'.join(self.get_build_configurations())}")
+        else:
+            args.append(f"-DCMAKE_BUILD_TYPE={self.configuration}")
+        if self.cmake_generator:
+            args.extend(["-G", self.cmake_generator])
+        if generator.is_configured():
+            log(f"Configure skipped, inputs are unchanged: {build_dir}")
+            return
+        self.run_process(args, build_dir, log)
+        generator.save_configure_fingerprint()
+
+    @build_utils.traced('Generate Fingerprint')
+    def get_generate_fingerprint(self, target_name):
+        paths = [
+            self.project_path,
+            os.path.join(self.project_dir, self.target_files.get(target_name, os.path.join(target_name, target_name + '.target'))),
+            os.path.join(script_folder, 'conanfile.py'),
+            os.path.join(script_folder, 'build_utils.py'),
+            self.get_lockfile_path(),
+        ] + self.get_conan_profile_paths()
+
+        fingerprint = hashlib.sha256()
+        for path in paths:
+            fingerprint.update(path.encode())
+            if os.path.isfile(path):
+                with open(path, 'rb') as f:
+                    fingerprint.update(f.read())
+        fingerprint.update(f'{target_name}\n{self.get_build_configurations()}\n{self.cmake_generator}'.encode())
+        return fingerprint.hexdigest()
+
+    def is_generated(self, build_dir, fingerprint):
+        fingerprint_path = os.path.join(build_dir, 'fingerprint.txt')
+        if not os.path.isfile(fingerprint_path) or not os.path.isfile(os.path.join(build_dir, 'CMakeLists.txt')):
+            return False
+
+        with open(fingerprint_path, 'r') as f:
+            if f.read() != fingerprint:
+                return False
+
+        return build_utils.SourceIndex(os.path.join(build_dir, 'source_index.json')).is_up_to_date()
+
+    @build_utils.traced('Generate Target')
+    def generate_target(self, target_name, log=print):
+        build_dir = self.get_build_dir(target_name)
+
+        fingerprint = self.get_generate_fingerprint(target_name)
+        if not self.force and self.is_generated(build_dir, fingerprint) and self.is_precompiled_header_registered(target_name):
+            log(f"Up to date: {build_dir}")
+            return
+
+        log(f"Create build directory: {build_dir}")
+        os.makedirs(build_dir, exist_ok=True)
 
         build_info_name = 'build_info.yaml'
-        build_info_path = os.path.join(self.build_dir, build_info_name)
+        build_info_path = os.path.join(build_dir, build_info_name)
         build_info_data = {
             "Project": self.project_path,
-            "Target": self.target,
+            "Target": target_name,
             "Configuration": self.configuration,
+            "Configurations": self.get_build_configurations(),
+            "Generator": self.generator,
+            "BuildRoot": self.get_build_root(),
         }
 
-        with open(build_info_path, "w") as f:
-            yaml.dump(build_info_data, f)
+        if build_utils.save_file(build_info_path, yaml.dump(build_info_data)):
+            log(f"Write: {build_info_path}")
 
-        src_conanfile = os.path.join(script_folder, 'conanfile.py')
-        dst_conanfile = os.path.join(self.build_dir, 'conanfile.py')
+        for file_name in ['conanfile.py', 'build_utils.py']:
+            src_file = os.path.join(script_folder, file_name)
+            dst_file = os.path.join(build_dir, file_name)
 
-        print(f"Copy: {src_conanfile} to {dst_conanfile}")
-        shutil.copy(src_conanfile, dst_conanfile)
+            if build_utils.copy_file(src_file, dst_file):
+                log(f"Copy: {src_file} to {dst_file}")
 
-        os.chdir(self.build_dir)
-        args = ["conan", "install", "conanfile.py", f"--settings=build_type={self.configuration}", "--build=missing"]
-        if self.generator:
-            args.extend(["-c", f"tools.cmake.cmaketoolchain:generator={self.generator}"])
-        print(*args)
-        subprocess.run(args, check=True)
+        dependency_key = self.get_dependency_key(target_name)
+        if self.restore_dependency_files(build_dir, dependency_key, log):
+            self.configure_target(build_dir, log)
+        else:
+            # The Conan cache isn't safe for concurrent installs, so they run one at a time
+            # and CMake is configured afterwards outside of the lock
+            env = dict(os.environ, BUILD_TOOLS_SKIP_CONFIGURE='1')
+            with conan_lock:
+                for configuration in self.get_build_configurations():
+                    args = ["conan", "install", "conanfile.py", f"--settings=build_type={configuration}", "--build=missing"]
+                    if self.cmake_generator:
+                        args.extend(["-c", f"tools.cmake.cmaketoolchain:generator={self.cmake_generator}"])
+                    lockfile_path = self.get_lockfile_path()
+                    if os.path.isfile(lockfile_path):
+                        args.extend([f"--lockfile={lockfile_path}", "--lockfile-partial"])
+                    self.run_process(args, build_dir, log, env)
+            self.publish_dependency_files(build_dir, dependency_key)
+            self.configure_target(build_dir, log)
+
+        build_utils.save_file(os.path.join(build_dir, 'fingerprint.txt'), fingerprint)
 
     def build(self):
         print("Building...")
 
-        os.chdir(self.build_dir)
-        args = ["cmake", "--build", self.build_dir, f'--config={self.configuration}']
-        print(*args)
-        subprocess.run(args, check=True)
+        self.load_project()
+        for owner_target_name in self.get_module_owners(self.target):
+            print(f"Build module interfaces of: {owner_target_name}")
+            self.build_target(owner_target_name)
+        self.build_target(self.target)
+        self.merge_compile_commands()
+
+    def build_all(self, jobs):
+        print("Building all targets...")
+
+        self.load_project()
+        try:
+            self.run_targets(self.build_target, jobs)
+        finally:
+            self.merge_compile_commands()
+
+    @build_utils.traced('Build Target')
+    def build_target(self, target_name, log=print):
+        target = self.find_target(target_name)
+        if target and target.get('Type', None) == 'Interface':
+            return
+
+        build_dir = self.get_build_dir(target_name)
+        # Every configuration of a multi-config tree keeps its own key
+        key_path = os.path.join(build_dir, f'artifact_key.{self.configuration}.txt')
+
+        cache = None
+        if self.use_artifact_cache and self.project.get('ArtifactCache', True):
+            cache = self.get_artifact_cache()
+            with self.artifact_lock:
+                if self.artifact_graph is None:
+                    self.artifact_graph = self.get_target_graph(precompiled_header_owners=False)
+            key = self.get_artifact_key(target_name, self.artifact_graph, self.artifact_keys)
+            # Outputs deleted or overwritten since the key was recorded are restored or rebuilt
+            if self.read_text(key_path) == key and cache.has_outputs(key, build_dir):
+                log(f"Up to date: {target_name}")
+                return
+
+            restored_files = cache.restore(key, build_dir)
+            if restored_files is not None:
+                log(f"Restored {len(restored_files)} files from the artifact cache: {key}")
+                build_utils.save_file(key_path, key)
+                return
+
+        # The outputs no longer match the recorded key once a build starts
+        if os.path.isfile(key_path):
+            os.remove(key_path)
+
+        if self.link_jobs:
+            self.set_link_jobs(build_dir, log)
+
+        self.build_precompiled_header_owner(target_name, log)
+
+        with build_utils.JobSlots() as job_slots:
+            jobs = job_slots.acquire(self.build_jobs or os.cpu_count())
+            args = ["cmake", "--build", build_dir, f'--config={self.configuration}', "--parallel", str(jobs)]
+            self.run_process(args, build_dir, log)
+
+        if cache:
+            other_configurations = [configuration for configuration in self.get_build_configurations() if configuration != self.configuration]
+            cache.store(key, build_dir, artifact_cache.find_artifacts(build_dir, target_name, other_configurations))
+            build_utils.save_file(key_path, key)
+
+    def build_precompiled_header_owner(self, target_name, log=print):
+        owner_target_name = self.get_precompiled_header_owner(target_name)
+        if not owner_target_name or self.multi_config:
+            return
+
+        # Only GCC includes the owner's precompiled header, the other compilers build their own
+        owner_build_dir = self.get_build_dir(owner_target_name)
+        compiler_files = glob.glob(os.path.join(owner_build_dir, 'CMakeFiles', '*', 'CMakeCXXCompiler.cmake'))
+        if not compiler_files or 'set(CMAKE_CXX_COMPILER_ID "GNU")' not in (self.read_text(compiler_files[0]) or ''):
+            return
+
+        # Ninja builds the precompiled header object alone, other generators build the whole owner
+        owner_cmake_target_name = os.path.basename(owner_target_name)
+        if self.get_cmake_cache_value(owner_build_dir, 'CMAKE_GENERATOR') == 'Ninja':
+            build_target_name = f'CMakeFiles/{owner_cmake_target_name}.dir/cmake_pch.hxx.gch'
+        else:
+            build_target_name = owner_cmake_target_name
+
+        log(f"Build precompiled header of: {owner_target_name}")
+        with build_utils.FileLock(os.path.join(owner_build_dir, 'precompiled_header.lock')):
+            self.run_process(["cmake", "--build", owner_build_dir, f'--config={self.configuration}', "--target", build_target_name], owner_build_dir, log)
+
+    def get_cmake_cache_value(self, build_dir, name):
+        for line in (self.read_text(os.path.join(build_dir, 'CMakeCache.txt')) or '').splitlines():
+            if line.startswith(f'{name}:'):
+                return line.split('=', 1)[1]
+        return None
+
+    def read_text(self, path):
+        if not os.path.isfile(path):
+            return None
+        with open(path, 'r') as f:
+            return f.read()
+
+    def get_artifact_cache(self):
+        cache_dir = os.environ.get('BUILD_TOOLS_ARTIFACT_CACHE') or build_utils.get_cache_dir(self.project_dir, 'Artifacts')
+        return artifact_cache.ArtifactCache(cache_dir, int(self.project.get('ArtifactCacheSize', 10240)) * 1024 * 1024)
+
+    @build_utils.traced('Artifact Key')
+    def get_artifact_key(self, target_name, graph, keys):
+        if target_name in keys:
+            return keys[target_name]
+
+        build_dir = self.get_build_dir(target_name)
+        hash_cache = build_utils.FileInfoCache(os.path.join(build_dir, 'artifact_hashes.json'))
+        source_index = build_utils.SourceIndex(os.path.join(build_dir, 'source_index.json'))
+
+        key = hashlib.sha256()
+        key.update(f'{target_name}\n{self.configuration}\n{self.get_build_configurations()}'.encode())
+
+        def update(path, base_dir):
+            if os.path.isfile(path):
+                key.update(os.path.relpath(path, base_dir).replace(os.sep, '/').encode())
+                key.update(hash_cache.get(path, artifact_cache.get_file_hash).encode())
+
+        # The generator's source index is reused, it only rescans folders that changed since Generate
+        target_dir = PureWindowsPath(os.path.normpath(self.get_target_dir(target_name))).as_posix()
+        for folder in ['Source', 'Include']:
+            files = source_index.scan(f'{target_dir}/{folder}')
+            for extension, paths in sorted(files.items()):
+                for path in paths:
+                    update(path, self.project_dir)
 
-    def package(self):
+        # Generated project files carry the flags and definitions, the Conan files carry settings and resolved revisions
+        update(os.path.join(self.project_dir, self.target_files.get(target_name, os.path.join(target_name, target_name + '.target'))), self.project_dir)
+        update(self.get_lockfile_path(), self.project_dir)
+        cmake_target_name = os.path.basename(target_name)
+        for file_name in ['build_info.yaml', 'CMakeLists.txt', f'{cmake_target_name}.hpp', f'{cmake_target_name}.pch.hpp']:
+            update(os.path.join(build_dir, file_name), build_dir)
+        for path in sorted(glob.glob(os.path.join(build_dir, 'CMake', '*.cmake'))):
+            update(path, build_dir)
+        # A reused precompiled header only contributes its content, not the owner's sources
+        owner_target_name = self.get_precompiled_header_owner(target_name)
+        if owner_target_name:
+            update(os.path.join(self.get_build_dir(owner_target_name), f'{os.path.basename(owner_target_name)}.pch.hpp'), self.get_build_root())
+        for file_name in sorted(os.listdir(build_dir)) if os.path.isdir(build_dir) else []:
+            if self.is_dependency_file(file_name):
+                update(os.path.join(build_dir, file_name), build_dir)
+        hash_cache.save()
+
+        for dependency_name in sorted(graph.get(target_name, [])):
+            key.update(self.get_artifact_key(dependency_name, graph, keys).encode())
+
+        keys[target_name] = key.hexdigest()
+        return keys[target_name]
+
+    def set_link_jobs(self, build_dir, log=print):
+        # The link pool size is fixed at configure time, so the cache is only updated when it differs
+        cache_path = os.path.join(build_dir, 'CMakeCache.txt')
+        if os.path.isfile(cache_path):
+            with open(cache_path, 'r') as f:
+                for line in f:
+                    if line.startswith('BUILD_TOOLS_LINK_JOBS:') and line.strip().split('=', 1)[1] == str(self.link_jobs):
+                        return
+
+        self.run_process(["cmake", f"-DBUILD_TOOLS_LINK_JOBS={self.link_jobs}", build_dir], build_dir, log)
+
+    def get_target_dir(self, target_name):
+        target_path = self.target_files.get(target_name)
+        if target_path:
+            return os.path.join(self.project_dir, os.path.dirname(target_path))
+        return os.path.join(self.project_dir, target_name)
+
+    def load_generator(self, build_dir):
+        target_name = build_utils.load_yaml(os.path.join(build_dir, 'build_info.yaml'))['Target']
+        sys.modules.pop('conanfile', None)
+        sys.path.insert(0, build_dir)
+        try:
+            spec = importlib.util.spec_from_file_location('conanfile', os.path.join(build_dir, 'conanfile.py'))
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+        finally:
+            sys.path.pop(0)
+
+        return module.TargetGenerator(target_name)
+
+    def get_file_set(self, roots):
+        file_set = set()
+        for root in roots:
+            _, files = build_utils.scan_directory(root)
+            for extension in ['cpp', 'ixx', 'hpp', 'h', 'inl']:
+                file_set.update(files.get(extension, []))
+        return file_set
+
+    def watch(self, interval, polling):
+        print("Watching...")
+
+        build_info_path = os.path.join(self.build_dir, 'build_info.yaml')
+        if not os.path.isfile(os.path.join(self.build_dir, 'CMakeLists.txt')) or not os.path.isfile(build_info_path):
+            raise RuntimeError(f'Target "{self.target}" is not generated, run Generate first.')
+
+        self.generator = build_utils.load_yaml(build_info_path).get('Generator', None)
+        self.force = False
+        self.load_project()
+
+        target_dir = self.get_target_dir(self.target)
+        roots = [os.path.join(target_dir, 'Source'), os.path.join(target_dir, 'Include')]
+        descriptor_paths = [self.project_path] + [os.path.join(self.project_dir, path) for path in self.target_files.values()]
+
+        # The generator keeps the parsed descriptors between rebuilds, only file set changes regenerate the project
+        generator = self.load_generator(self.build_dir)
+        file_set = self.get_file_set(roots)
+        watcher = watch.create_watcher(roots, descriptor_paths, interval, polling)
+
+        while True:
+            try:
+                self.build_target(self.target)
+            except subprocess.CalledProcessError as e:
+                print(f"Build failed: {e}")
+
+            print(f"Waiting for changes in {target_dir}...")
+            changed_paths = watcher.wait()
+
+            if any(path in descriptor_paths for path in changed_paths):
+                print("Descriptors changed, regenerating...")
+                self.generate_vscode_project(self.project_path)
+                self.generate_target(self.target)
+                generator = self.load_generator(self.build_dir)
+                file_set = self.get_file_set(roots)
+                continue
+
+            new_file_set = self.get_file_set(roots)
+            if new_file_set != file_set:
+                print(f"File set changed: {len(new_file_set - file_set)} added, {len(file_set - new_file_set)} removed")
+                generator._source_index = None
+                generator.generate_project()
+                file_set = new_file_set
+
+    def get_changed_paths(self, diff):
+        args = ["git", "diff", "--name-only", "--relative", diff]
+        result = subprocess.run(args, cwd=self.project_dir, stdout=subprocess.PIPE, text=True, check=True)
+        return [os.path.join(self.project_dir, line) for line in result.stdout.splitlines() if line]
+
+    def get_affected_targets(self, paths):
+        target_dirs = {os.path.normcase(os.path.abspath(self.get_target_dir(target['Name']))): target['Name'] for target in self.targets}
+
+        # Interface changes reach every target that includes the headers, source changes stay in their target
+        changed_targets = set()
+        changed_interfaces = set()
+        for path in paths:
+            path = os.path.normcase(os.path.abspath(os.path.join(self.project_dir, path)))
+            if path == os.path.normcase(os.path.abspath(self.project_path)):
+                print(f"Project changed: {path}")
+                return {target['Name'] for target in self.targets}
+
+            target_dir = path
+            while target_dir not in target_dirs and os.path.dirname(target_dir) != target_dir:
+                target_dir = os.path.dirname(target_dir)
+            target_name = target_dirs.get(target_dir)
+            if not target_name:
+                print(f"Not part of a target: {path}")
+                continue
+
+            folder = os.path.relpath(path, target_dir).split(os.sep)[0]
+            changed_targets.add(target_name)
+            if folder != 'Source':
+                changed_interfaces.add(target_name)
+
+        # Every affected binary is relinked into the targets that link it statically
+        dependents = self.get_reverse_target_graph()
+        affected = set(changed_targets)
+        stack = [(target_name, target_name in changed_interfaces) for target_name in changed_targets]
+        visited = set(stack)
+        while stack:
+            target_name, interface_changed = stack.pop()
+            for dependent_name, propagates, static in dependents.get(target_name, []):
+                if not interface_changed and not static:
+                    continue
+                affected.add(dependent_name)
+                # A private dependency stays out of the dependent's own headers, so it isn't passed on
+                entry = (dependent_name, interface_changed and propagates)
+                if entry not in visited:
+                    visited.add(entry)
+                    stack.append(entry)
+        return affected
+
+    def affected(self, paths, diff, build, jobs):
+        self.load_project()
+
+        paths = list(paths)
+        if diff:
+            paths.extend(self.get_changed_paths(diff))
+
+        affected = self.get_affected_targets(paths)
+        graph = self.get_target_graph()
+        # Targets are listed in dependency order so the output can be built one by one
+        ordered = []
+        while len(ordered) < len(affected):
+            ready = sorted(target_name for target_name in affected if target_name not in ordered and not (graph[target_name] & affected) - set(ordered))
+            if not ready:
+                ordered.extend(sorted(affected - set(ordered)))
+                break
+            ordered.extend(ready)
+
+        for target_name in ordered:
+            print(target_name)
+
+        if build and affected:
+            self.run_targets(self.build_target, jobs, affected)
+
+    def run_executable(self, arguments):
+        output_dir = os.path.join(self.build_dir, self.configuration) if self.multi_config else self.build_dir
+        executable_path = os.path.join(output_dir, os.path.basename(self.target) + ('.exe' if sys.platform == 'win32' else ''))
+        if not os.path.isfile(executable_path):
+            raise RuntimeError(f'{executable_path} not found, build the target first.')
+
+        # The environment comes from the cached JSON instead of sourcing the Conan scripts on every launch
+        variables = build_utils.load_run_environment(self.build_dir, self.configuration)
+        environment = build_utils.resolve_run_environment(variables, os.environ)
+
+        if arguments and arguments[0] == '--':
+            arguments = arguments[1:]
+        sys.stdout.flush()
+        if sys.platform == 'win32':
+            sys.exit(subprocess.run([executable_path] + arguments, env=environment).returncode)
+        os.execve(executable_path, [executable_path] + arguments, environment)
+
+    def report(self, count=20):
+        print("Reporting...")
+
+        ninja_log.report(self.build_dir, count, os.path.join(self.build_dir, 'ninja_trace.json'))
+
+    def package(self, output_dir, jobs):
         print("Packaging...")
 
+        self.load_project()
+        output_dir = output_dir or os.path.join(self.project_dir, '.Build', 'Package')
+
+        # Every target is collected each time so shared libraries are deduplicated over the whole project,
+        # only archives whose files changed are written again
+        for configuration in self.get_build_configurations():
+            other_configurations = [name for name in self.get_build_configurations() if name != configuration]
+
+            target_files = {}
+            for target in self.targets:
+                if target.get('Type', None) == 'Interface':
+                    continue
+                build_dir = self.get_build_dir(target['Name'])
+                if not os.path.isdir(build_dir):
+                    print(f"Not built: {target['Name']}")
+                    continue
+                target_files[target['Name']] = package_archives.collect_target_files(build_dir, target['Name'], configuration, other_configurations)
+
+            package_archives.Packager(os.path.join(output_dir, configuration)).package(target_files, jobs)
+
 def main():
     parser = argparse.ArgumentParser(description="Script to call different functions.")
     subparsers = parser.add_subparsers(dest="Command", help="Available commands")
@@ -215,13 +1037,84 @@ def main():
     generate_parser.add_argument("--Target", help="Target")
     generate_parser.add_argument("--Generator", help="Generator", default=None)
     generate_parser.add_argument("--Configuration", help="Target", default='Release')
+    generate_parser.add_argument("--MultiConfig", help="Use one build tree for all configurations of the project", action='store_true')
+    generate_parser.add_argument("--Trace", help="Record phase timings to .Build/.Trace", action='store_true')
+    generate_parser.add_argument("--Profile", help="Record a cProfile dump next to the trace", action='store_true')
+    generate_parser.add_argument("--Force", help="Regenerate even if nothing changed", action='store_true')
+    generate_parser.add_argument("--UpdatePrecompiledHeaders", help="Select the automatically precompiled headers again", action='store_true')
 
     build_parser = subparsers.add_parser("Build", help="Build")
     build_parser.add_argument("--Project", help="Project", default=os.getcwd())
     build_parser.add_argument("--Target", help="Target")
     build_parser.add_argument("--Configuration", help="Target", default='Release')
+    build_parser.add_argument("--MultiConfig", help="Use one build tree for all configurations of the project", action='store_true')
+    build_parser.add_argument("--Trace", help="Record phase timings to .Build/.Trace", action='store_true')
+    build_parser.add_argument("--Profile", help="Record a cProfile dump next to the trace", action='store_true')
+    build_parser.add_argument("--Timings", help="Print a build time report", action='store_true')
+    build_parser.add_argument("--Jobs", help="Maximum number of parallel build steps, limited by the jobs of other running builds", type=int, default=None)
+    build_parser.add_argument("--LinkJobs", help="Size of the Ninja link pool", type=int, default=None)
+    build_parser.add_argument("--NoCache", help="Don't restore or store outputs in the artifact cache", action='store_true')
+
+    generate_all_parser = subparsers.add_parser("GenerateAll", help="Generate all targets in dependency order")
+    generate_all_parser.add_argument("--Project", help="Project", default=os.getcwd())
+    generate_all_parser.add_argument("--Generator", help="Generator", default=None)
+    generate_all_parser.add_argument("--Configuration", help="Target", default='Release')
+    generate_all_parser.add_argument("--MultiConfig", help="Use one build tree for all configurations of the project", action='store_true')
+    generate_all_parser.add_argument("--Trace", help="Record phase timings to .Build/.Trace", action='store_true')
+    generate_all_parser.add_argument("--Profile", help="Record a cProfile dump next to the trace", action='store_true')
+    generate_all_parser.add_argument("--Force", help="Regenerate even if nothing changed", action='store_true')
+    generate_all_parser.add_argument("--UpdatePrecompiledHeaders", help="Select the automatically precompiled headers again", action='store_true')
+    generate_all_parser.add_argument("--Jobs", help="Number of targets processed in parallel", type=int, default=os.cpu_count())
+
+    build_all_parser = subparsers.add_parser("BuildAll", help="Build all targets in dependency order")
+    build_all_parser.add_argument("--Project", help="Project", default=os.getcwd())
+    build_all_parser.add_argument("--Configuration", help="Target", default='Release')
+    build_all_parser.add_argument("--MultiConfig", help="Use one build tree for all configurations of the project", action='store_true')
+    build_all_parser.add_argument("--Trace", help="Record phase timings to .Build/.Trace", action='store_true')
+    build_all_parser.add_argument("--Profile", help="Record a cProfile dump next to the trace", action='store_true')
+    build_all_parser.add_argument("--Jobs", help="Number of targets processed in parallel", type=int, default=os.cpu_count())
+    build_all_parser.add_argument("--LinkJobs", help="Size of the Ninja link pool", type=int, default=None)
+    build_all_parser.add_argument("--NoCache", help="Don't restore or store outputs in the artifact cache", action='store_true')
+
+    affected_parser = subparsers.add_parser("Affected", help="List or build the targets affected by changed files")
+    affected_parser.add_argument("Paths", help="Changed files", nargs='*')
+    affected_parser.add_argument("--Project", help="Project", default=os.getcwd())
+    affected_parser.add_argument("--Diff", help="Git revision range whose changed files are added, e.g. main...HEAD", default=None)
+    affected_parser.add_argument("--Configuration", help="Target", default='Release')
+    affected_parser.add_argument("--MultiConfig", help="Use one build tree for all configurations of the project", action='store_true')
+    affected_parser.add_argument("--Build", help="Build the affected targets in dependency order", action='store_true')
+    affected_parser.add_argument("--Jobs", help="Number of targets processed in parallel", type=int, default=os.cpu_count())
+    affected_parser.add_argument("--LinkJobs", help="Size of the Ninja link pool", type=int, default=None)
+    affected_parser.add_argument("--NoCache", help="Don't restore or store outputs in the artifact cache", action='store_true')
+
+    run_parser = subparsers.add_parser("Run", help="Run a target's executable with its cached runtime environment")
+    run_parser.add_argument("--Project", help="Project", default=os.getcwd())
+    run_parser.add_argument("--Target", help="Target")
+    run_parser.add_argument("--Configuration", help="Target", default='Release')
+    run_parser.add_argument("--MultiConfig", help="Use one build tree for all configurations of the project", action='store_true')
+    run_parser.add_argument("Arguments", help="Arguments passed to the executable after --", nargs=argparse.REMAINDER)
+
+    watch_parser = subparsers.add_parser("Watch", help="Rebuild a target whenever its files change")
+    watch_parser.add_argument("--Project", help="Project", default=os.getcwd())
+    watch_parser.add_argument("--Target", help="Target")
+    watch_parser.add_argument("--Configuration", help="Target", default='Release')
+    watch_parser.add_argument("--MultiConfig", help="Use one build tree for all configurations of the project", action='store_true')
+    watch_parser.add_argument("--Interval", help="Polling interval in seconds", type=float, default=1.0)
+    watch_parser.add_argument("--Polling", help="Poll for changes instead of using inotify", action='store_true')
+
+    report_parser = subparsers.add_parser("Report", help="Report build times from the ninja log")
+    report_parser.add_argument("--Project", help="Project", default=os.getcwd())
+    report_parser.add_argument("--Target", help="Target")
+    report_parser.add_argument("--Configuration", help="Target", default='Release')
+    report_parser.add_argument("--MultiConfig", help="Use one build tree for all configurations of the project", action='store_true')
+    report_parser.add_argument("--Count", help="Number of slowest steps listed per step kind", type=int, default=20)
 
-    package_parser = subparsers.add_parser("Package", help="Package")
+    package_parser = subparsers.add_parser("Package", help="Package the outputs and runtime libraries of every target into archives")
+    package_parser.add_argument("--Project", help="Project", default=os.getcwd())
+    package_parser.add_argument("--Configuration", help="Target", default='Release')
+    package_parser.add_argument("--MultiConfig", help="Use one build tree for all configurations of the project", action='store_true')
+    package_parser.add_argument("--Output", help="Folder the archives are written to, one subfolder per configuration", default=None)
+    package_parser.add_argument("--Jobs", help="Number of archives compressed in parallel", type=int, default=os.cpu_count())
 
     args = parser.parse_args()
     if not ProjectTools().run(args):
@@ -0,0 +1,118 @@
+import os
+import sys
+import time
+import select
+import struct
+import ctypes
+import ctypes.util
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0x00000800
+
+watch_mask = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+
+def walk_directories(roots):
+    for root in roots:
+        if not os.path.isdir(root):
+            continue
+        for path, dir_names, file_names in os.walk(root):
+            dir_names[:] = [name for name in dir_names if not name.startswith('.')]
+            yield path, file_names
+
+class InotifyWatcher:
+
+    def __init__(self, roots, paths):
+        libc_name = ctypes.util.find_library('c')
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+        self.watches = {}
+        for path, _ in walk_directories(roots):
+            self.add_watch(path)
+        # Descriptor files are often replaced on save, so their folders are watched instead
+        for path in paths:
+            if os.path.isdir(os.path.dirname(path)):
+                self.add_watch(os.path.dirname(path))
+
+    def add_watch(self, path):
+        descriptor = self.libc.inotify_add_watch(self.fd, os.fsencode(path), watch_mask)
+        if descriptor >= 0:
+            self.watches[descriptor] = path
+
+    def read_events(self):
+        changed_paths = []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return changed_paths
+
+        offset = 0
+        while offset < len(data):
+            descriptor, mask, cookie, length = struct.unpack_from('iIII', data, offset)
+            name = data[offset + 16:offset + 16 + length].rstrip(b'\0').decode(errors='ignore')
+            offset += 16 + length
+
+            path = os.path.join(self.watches.get(descriptor, ''), name) if name else self.watches.get(descriptor, '')
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                for sub_path, _ in walk_directories([path]):
+                    self.add_watch(sub_path)
+            changed_paths.append(path)
+        return changed_paths
+
+    def wait(self, debounce=0.2):
+        select.select([self.fd], [], [])
+        changed_paths = self.read_events()
+
+        # Editors and version control touch several files at once, so events are collected until they settle
+        while select.select([self.fd], [], [], debounce)[0]:
+            changed_paths.extend(self.read_events())
+        return changed_paths
+
+class PollingWatcher:
+
+    def __init__(self, roots, paths, interval=1.0):
+        self.roots = roots
+        self.paths = paths
+        self.interval = interval
+        self.snapshot = self.take_snapshot()
+
+    def take_snapshot(self):
+        snapshot = {}
+        for path, file_names in walk_directories(self.roots):
+            for file_name in file_names:
+                file_path = os.path.join(path, file_name)
+                try:
+                    snapshot[file_path] = os.stat(file_path).st_mtime_ns
+                except OSError:
+                    pass
+        for path in self.paths:
+            try:
+                snapshot[path] = os.stat(path).st_mtime_ns
+            except OSError:
+                pass
+        return snapshot
+
+    def wait(self):
+        while True:
+            time.sleep(self.interval)
+            snapshot = self.take_snapshot()
+            if snapshot != self.snapshot:
+                changed_paths = [path for path in snapshot.keys() | self.snapshot.keys() if snapshot.get(path) != self.snapshot.get(path)]
+                self.snapshot = snapshot
+                return changed_paths
+
+def create_watcher(roots, paths, interval, polling=False):
+    if not polling and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(roots, paths)
+        except (OSError, AttributeError) as e:
+            print(f'inotify is not available ({e}), falling back to polling')
+    return PollingWatcher(roots, paths, interval)